@@ -1 +1,7 @@
-from pyxarf.xarf import Xarf
\ No newline at end of file
+from pyxarf.xarf import Xarf
+from pyxarf.registry import SchemaRegistry, default_registry
+from pyxarf.report import XarfReport
+from pyxarf.evidence import Evidence
+from pyxarf.jsonio import dump_many, set_json_backend
+from pyxarf.bundle import compile_bundle, load_bundle
+from pyxarf.parallel import validate_many
@@ -0,0 +1,84 @@
+'''
+:copyright: (c) 2014 by abusix GmbH
+:license: Apache2, see LICENSE.txt for more details.
+
+asyncio helpers for loading schemas without blocking the event loop,
+requires python 3
+
+'''
+import asyncio
+
+from concurrent.futures import ThreadPoolExecutor
+from .registry import default_registry
+
+# downloads run in this pool over the keep-alive session of the registry
+_executor = ThreadPoolExecutor(max_workers=4)
+
+
+async def aload(registry, schema_url, schema_cache=None, headers=None):
+    '''
+    returns the cached entry for the given schema url, downloading
+    and converting the schema in a worker thread on first use.
+    concurrent callers asking for the same missing schema, even from
+    different event loops, await the same download.
+
+    :param registry: schema registry to load the schema into
+    :type registry: :py:class:`pyxarf.registry.SchemaRegistry`
+    :param schema_url: url to get schema from
+    :type schema_url: string
+    :param schema_cache: path where to cache schemas
+    :type schema_cache: string
+    :param headers: http headers sent with the download request
+    :type headers: dict
+
+    :returns: cached schema entry
+    :rtype: :py:class:`pyxarf.registry.SchemaEntry`
+
+    :raises: :py:class:`GeneralError`: if the schema could not be loaded
+
+    '''
+    entry = registry._lookup(schema_url)
+    if entry is not None:
+        return entry
+
+    with registry._lock:
+        future = registry._pending.get(schema_url)
+
+        if future is None:
+            future = _executor.submit(
+                registry._get_missing, schema_url, schema_cache, headers
+            )
+            registry._pending[schema_url] = future
+            future.add_done_callback(
+                lambda f: registry._pending.pop(schema_url, None)
+            )
+
+    return await asyncio.wrap_future(future)
+
+
+async def acreate(cls, **kwargs):
+    '''
+    creates an xarf object after loading its schema without blocking
+    the event loop, see :py:class:`pyxarf.xarf.Xarf` for parameters
+
+    :param cls: xarf class to instantiate
+    :type cls: class
+    :param kwargs: xarf parameters
+    :type kwargs: dict
+
+    :returns: instance of cls
+    :rtype: instance
+
+    '''
+    registry = kwargs.get('registry')
+    if registry is None:
+        registry = default_registry
+
+    if kwargs.get('schema_url'):
+        await aload(
+            registry,
+            kwargs['schema_url'],
+            kwargs.get('schema_cache'),
+            cls.http_headers,
+        )
+    return cls(**kwargs)
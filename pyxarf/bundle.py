@@ -0,0 +1,133 @@
+'''
+:copyright: (c) 2014 by abusix GmbH
+:license: Apache2, see LICENSE.txt for more details.
+
+precompiled schema bundles for starting without network access.
+
+a bundle is a single pickle file holding converted schemas and their
+required keys. if the environment variable PYXARF_SCHEMA_BUNDLE points
+to a bundle, it is loaded into the process-wide registry when pyxarf
+gets imported; a bundle which can not be loaded there only logs a
+warning. bundles are unpickled, so only load trusted files.
+
+'''
+import logging
+import mmap
+import os
+import pickle
+
+from .exceptions import GeneralError
+from .registry import SchemaEntry, default_registry
+from .xarf import Xarf
+
+BUNDLE_ENV = 'PYXARF_SCHEMA_BUNDLE'
+BUNDLE_VERSION = 1
+
+_logger = logging.getLogger(__name__)
+
+
+def compile_bundle(schema_urls, path, schema_cache=None, registry=None):
+    '''
+    loads the given schemas and writes them converted to a bundle
+
+    :param schema_urls: urls of json schemas
+    :type schema_urls: list
+    :param path: path of bundle file
+    :type path: string
+    :param schema_cache: path where to cache schemas
+    :type schema_cache: string
+    :param registry: schema registry, defaults to the process-wide one
+    :type registry: :py:class:`pyxarf.registry.SchemaRegistry`
+
+    :raises: :py:class:`GeneralError`: if a schema could not be loaded
+    :raises: :py:class:`GeneralError`: if the bundle could not be written
+
+    '''
+    if registry is None:
+        registry = default_registry
+
+    schemas = {}
+    for schema_url in schema_urls:
+        entry = registry.get(schema_url, schema_cache, Xarf.http_headers)
+        schemas[schema_url] = (entry.schema, entry.required_keys)
+
+    bundle = {'version': BUNDLE_VERSION, 'schemas': schemas}
+
+    from tempfile import mkstemp
+
+    tmp_path = None
+    try:
+        (fd, tmp_path) = mkstemp(
+            prefix='.%s.' % os.path.basename(path),
+            dir=os.path.dirname(os.path.abspath(path)),
+        )
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(bundle, f, pickle.HIGHEST_PROTOCOL)
+        os.chmod(tmp_path, 0o644)
+        os.rename(tmp_path, path)
+    except Exception as error:
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise GeneralError('could not write schema bundle: %s' % error)
+
+
+def load_bundle(path, registry=None):
+    '''
+    memory maps the given bundle and adds its schemas to the registry,
+    pinned so they are never evicted
+
+    :param path: path of bundle file
+    :type path: string
+    :param registry: schema registry, defaults to the process-wide one
+    :type registry: :py:class:`pyxarf.registry.SchemaRegistry`
+
+    :returns: number of loaded schemas
+    :rtype: int
+
+    :raises: :py:class:`GeneralError`: if the bundle could not be read
+
+    '''
+    if registry is None:
+        registry = default_registry
+
+    try:
+        with open(path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            bundle = pickle.load(data)
+        finally:
+            data.close()
+    except Exception as error:
+        raise GeneralError('could not read schema bundle: %s' % error)
+
+    if not isinstance(bundle, dict):
+        raise GeneralError('could not read schema bundle: not a bundle')
+    if bundle.get('version') != BUNDLE_VERSION:
+        raise GeneralError(
+            'unsupported schema bundle version: %s' % bundle.get('version')
+        )
+
+    try:
+        entries = [
+            SchemaEntry(schema_url, schema, required_keys)
+            for schema_url, (schema, required_keys)
+            in bundle['schemas'].items()
+        ]
+    except (AttributeError, KeyError, TypeError, ValueError) as error:
+        raise GeneralError('could not read schema bundle: %s' % error)
+
+    for entry in entries:
+        registry.add(entry, pin=True)
+
+    return len(entries)
+
+
+if os.environ.get(BUNDLE_ENV):
+    # a broken bundle must not break every importer of pyxarf
+    try:
+        load_bundle(os.environ[BUNDLE_ENV])
+    except GeneralError as error:
+        _logger.warning(
+            'schemas of %s=%s not loaded: %s',
+            BUNDLE_ENV, os.environ[BUNDLE_ENV], error
+        )
@@ -0,0 +1,212 @@
+'''
+:copyright: (c) 2014 by abusix GmbH
+:license: Apache2, see LICENSE.txt for more details.
+
+on-disk schema cache with http revalidation metadata
+
+'''
+import os
+
+from contextlib import contextmanager
+from os.path import basename, getmtime, isfile
+from json import dumps as json_dumps, loads as json_loads
+from time import time
+
+
+class SchemaCache(object):
+    '''
+    directory of downloaded schemas. every schema file is accompanied
+    by a ``.meta`` sidecar holding the ETag and Last-Modified headers
+    of the download and the time it was last fetched or revalidated.
+    after a failed revalidation the sidecar records when to retry, the
+    stale copy counts as fresh until then.
+
+    files are replaced atomically, so readers never see a partially
+    written schema, and downloads can be serialized between processes
+    sharing the cache with :py:func:`lock`.
+
+    :param path: path where to cache schemas
+    :type path: string
+    :param ttl: seconds until a cached schema needs revalidation,
+        None to never revalidate
+    :type ttl: float
+    :param retry_ttl: seconds until a failed revalidation is retried
+    :type retry_ttl: float
+
+    '''
+    def __init__(self, path, ttl=None, retry_ttl=300):
+        self.path = path.rstrip('/')
+        self.ttl = ttl
+        self.retry_ttl = retry_ttl
+
+    def get_path(self, schema_file):
+        '''
+        returns the path of the given schema file inside the cache
+
+        :param schema_file: file name of schema
+        :type schema_file: string
+
+        :returns: full path of schema file
+        :rtype: string
+
+        '''
+        return '%s/%s' % (self.path, schema_file)
+
+    @contextmanager
+    def lock(self, schema_file, blocking=True):
+        '''
+        holds an exclusive lock on the given schema file, blocking
+        until other processes or threads released it. without fcntl,
+        e.g. on windows, nothing is locked.
+
+        :param schema_file: file name of schema
+        :type schema_file: string
+        :param blocking: wait for the lock, otherwise give up at once
+            if it is held
+        :type blocking: bool
+
+        :returns: context manager yielding whether the lock is held
+        :rtype: bool
+
+        '''
+        try:
+            import fcntl
+        except ImportError:
+            yield True
+            return
+
+        fd = os.open(
+            self.get_path(schema_file) + '.lock', os.O_RDWR | os.O_CREAT, 0o644
+        )
+        try:
+            try:
+                fcntl.flock(
+                    fd, fcntl.LOCK_EX if blocking else
+                    fcntl.LOCK_EX | fcntl.LOCK_NB
+                )
+            except (IOError, OSError):
+                if blocking:
+                    raise
+                yield False
+            else:
+                yield True
+        finally:
+            os.close(fd)
+
+    def read(self, schema_file):
+        '''
+        reads a schema and its metadata from the cache. schemas cached
+        without sidecar count as fetched when the file was written.
+
+        :param schema_file: file name of schema
+        :type schema_file: string
+
+        :returns: schema text or None if not cached, and metadata
+        :rtype: tuple
+
+        '''
+        full_path = self.get_path(schema_file)
+        if not isfile(full_path):
+            return (None, {})
+
+        with open(full_path, 'r') as f:
+            schema = f.read()
+
+        meta_path = full_path + '.meta'
+        if isfile(meta_path):
+            with open(meta_path, 'r') as f:
+                meta = json_loads(f.read())
+        else:
+            meta = {'fetched': getmtime(full_path)}
+
+        return (schema, meta)
+
+    def is_fresh(self, meta):
+        '''
+        checks if a cached schema can be used without revalidation
+
+        :param meta: metadata of cached schema
+        :type meta: dict
+
+        :returns: True if the schema is younger than the ttl or its
+            revalidation failed less than retry_ttl ago
+        :rtype: bool
+
+        '''
+        if self.ttl is None:
+            return True
+        now = time()
+        if now < meta.get('retry_after', 0):
+            return True
+        return now - meta.get('fetched', 0) < self.ttl
+
+    def write_failure(self, schema_file, meta):
+        '''
+        records a failed revalidation of a cached schema, so it is only
+        retried after retry_ttl seconds
+
+        :param schema_file: file name of schema
+        :type schema_file: string
+        :param meta: metadata of cached schema
+        :type meta: dict
+
+        '''
+        meta = dict(meta)
+        meta['retry_after'] = time() + self.retry_ttl
+        self.write_meta(schema_file, meta)
+
+    def write(self, schema_file, schema, meta):
+        '''
+        writes a schema and its metadata to the cache
+
+        :param schema_file: file name of schema
+        :type schema_file: string
+        :param schema: schema text
+        :type schema: string
+        :param meta: metadata of schema
+        :type meta: dict
+
+        '''
+        self._write_atomic(self.get_path(schema_file), schema)
+        self.write_meta(schema_file, meta)
+
+    def write_meta(self, schema_file, meta):
+        '''
+        writes only the metadata of a cached schema, e.g. after the
+        server confirmed the cached copy is still current
+
+        :param schema_file: file name of schema
+        :type schema_file: string
+        :param meta: metadata of schema
+        :type meta: dict
+
+        '''
+        self._write_atomic(
+            self.get_path(schema_file) + '.meta', json_dumps(meta)
+        )
+
+    def _write_atomic(self, full_path, data):
+        '''
+        writes data to a temporary file next to full_path and renames
+        it to full_path
+
+        :param full_path: path of file to replace
+        :type full_path: string
+        :param data: file content
+        :type data: string
+
+        '''
+        from tempfile import mkstemp
+
+        (fd, tmp_path) = mkstemp(
+            prefix='.%s.' % basename(full_path), dir=self.path
+        )
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(data)
+            # mkstemp only grants access to the owner
+            os.chmod(tmp_path, 0o644)
+            os.rename(tmp_path, full_path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
@@ -0,0 +1,158 @@
+'''
+:copyright: (c) 2014 by abusix GmbH
+:license: Apache2, see LICENSE.txt for more details.
+
+direct yaml emitter for flat mappings of scalars like the machine
+readable part. it writes the same output as ``yaml.dump(mapping,
+default_flow_style=False)`` for the values it can handle and gives up
+on everything else, so callers fall back to yaml.
+
+'''
+import math
+import re
+
+# printable ascii without leading and trailing spaces, which yaml may
+# write plain or single quoted on one line
+_simple = re.compile(r'^[!-~](?:[ -~]*[!-~])?$')
+# characters which must not start a plain scalar
+_indicators = set('#,[]{}&*!|>\'"%@`')
+# yaml folds lines longer than this
+_width = 80
+
+_resolvers = None
+
+try:
+    _text_types = (str, unicode)
+except NameError:
+    _text_types = (str,)
+
+
+def _get_resolvers():
+    '''
+    returns yaml's implicit resolvers, deciding which plain scalars are
+    read as something else than a string
+    '''
+    global _resolvers
+
+    if _resolvers is None:
+        from yaml.resolver import Resolver
+        _resolvers = Resolver.yaml_implicit_resolvers
+    return _resolvers
+
+
+def _is_plain(value):
+    '''
+    checks if yaml writes a simple string as plain scalar
+
+    :param value: string matching _simple
+    :type value: string
+
+    :rtype: bool
+    '''
+    first = value[0]
+    if first in _indicators:
+        return False
+    if first in '?:-' and (len(value) == 1 or value[1] == ' '):
+        return False
+    if value[:3] in ('---', '...'):
+        return False
+    if value[-1] == ':' or ': ' in value or ' #' in value:
+        return False
+
+    for (tag, regexp) in _get_resolvers().get(first, ()):
+        if regexp.match(value):
+            return False
+    return True
+
+
+def _scalar(value):
+    '''
+    returns a scalar as yaml writes it in a block mapping, or None if
+    it is not supported
+
+    :param value: scalar value
+    :type value: string, bool, int, float or None
+
+    :rtype: string
+    '''
+    if isinstance(value, _text_types):
+        if value == '':
+            return "''"
+        if not _simple.match(value):
+            return None
+        if _is_plain(value):
+            return value
+        return "'%s'" % value.replace("'", "''")
+
+    if value is None:
+        return 'null'
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    if type(value) is int:
+        return str(value)
+    if type(value) is float:
+        if math.isnan(value):
+            return '.nan'
+        if math.isinf(value):
+            return '.inf' if value > 0 else '-.inf'
+        text = repr(value).lower()
+        if '.' not in text and 'e' in text:
+            text = text.replace('e', '.0e', 1)
+        return text
+    return None
+
+
+def dump_flat_mapping(mapping):
+    '''
+    returns a flat mapping of scalars as block style yaml document,
+    identical to ``yaml.dump(mapping, default_flow_style=False)``
+
+    :param mapping: mapping with string keys and scalar values
+    :type mapping: dict
+
+    :returns: yaml document or None if the mapping is not supported
+    :rtype: string
+    '''
+    if not mapping:
+        return None
+
+    lines = []
+    try:
+        keys = sorted(mapping)
+    except TypeError:
+        return None
+
+    for key in keys:
+        if not isinstance(key, _text_types) or not _simple.match(key) or \
+                not _is_plain(key):
+            return None
+
+        value = _scalar(mapping[key])
+        if value is None:
+            return None
+
+        line = '%s: %s' % (key, value)
+        if len(line) > _width:
+            return None
+        lines.append(line)
+
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def dump_yaml(data):
+    '''
+    returns data as block style yaml document, written by the libyaml
+    based emitter if available
+
+    :param data: data to dump
+    :type data: dict
+
+    :rtype: string
+    '''
+    import yaml
+
+    dumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+    return yaml.dump(data, Dumper=dumper, default_flow_style=False)
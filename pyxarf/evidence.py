@@ -0,0 +1,124 @@
+'''
+:copyright: (c) 2014 by abusix GmbH
+:license: Apache2, see LICENSE.txt for more details.
+
+evidence kept by reference, for large or binary evidence which should
+not be loaded into memory as one string
+
+'''
+
+# multiple of 57 bytes, which base64 encode to one 76 character line
+CHUNK_SIZE = 57 * 1024
+
+try:
+    _text_types = (str, unicode)
+except NameError:
+    _text_types = (str,)
+
+
+class Evidence(object):
+    '''
+    evidence read from a file path, a binary file object or a buffer
+    (bytes, bytearray, memoryview) only when it is used, chunk by chunk.
+    file objects are read from the position they had when the evidence
+    was created, every time the evidence is used.
+
+    :param source: path, file object or buffer holding the evidence
+    :type source: string, file or memoryview
+
+    '''
+    __slots__ = ('source', '_offset')
+
+    def __init__(self, source):
+        self.source = source
+        self._offset = None
+
+        if hasattr(source, 'read'):
+            try:
+                self._offset = source.tell()
+            except (AttributeError, IOError, OSError):
+                pass
+
+    def __repr__(self):
+        return '<Evidence %r>' % (self.source,)
+
+    def iter_chunks(self, size=CHUNK_SIZE):
+        '''
+        yields the evidence as bytes in chunks of up to size bytes
+
+        :param size: maximum chunk size
+        :type size: int
+
+        :returns: generator of chunks
+        :rtype: generator
+
+        '''
+        if isinstance(self.source, (bytes, bytearray, memoryview)):
+            view = memoryview(self.source)
+            for start in range(0, len(view), size):
+                yield view[start:start + size].tobytes()
+            return
+
+        if hasattr(self.source, 'read'):
+            if self._offset is not None:
+                self.source.seek(self._offset)
+            for chunk in _read_chunks(self.source, size):
+                yield chunk
+            return
+
+        with open(self.source, 'rb') as f:
+            for chunk in _read_chunks(f, size):
+                yield chunk
+
+    def read(self):
+        '''
+        returns the whole evidence
+
+        :rtype: bytes
+
+        '''
+        return b''.join(self.iter_chunks())
+
+    def text(self):
+        '''
+        returns the whole evidence decoded as utf-8, invalid bytes are
+        replaced
+
+        :rtype: unicode
+
+        '''
+        return self.read().decode('utf-8', 'replace')
+
+
+def _read_chunks(f, size):
+    '''
+    yields chunks read from a file object, encoding text as utf-8
+    '''
+    while True:
+        chunk = f.read(size)
+        if not chunk:
+            return
+        if not isinstance(chunk, bytes):
+            chunk = chunk.encode('utf-8')
+        yield chunk
+
+
+def as_evidence(evidence=None, path=None):
+    '''
+    returns evidence text unchanged and wraps paths, file objects and
+    buffers in :py:class:`Evidence`
+
+    :param evidence: evidence text, file object or buffer
+    :type evidence: string, file or memoryview
+    :param path: path of a file holding the evidence
+    :type path: string
+
+    :returns: evidence for :py:class:`pyxarf.Xarf`
+    :rtype: string or :py:class:`Evidence`
+
+    '''
+    if path is not None:
+        return Evidence(path)
+    if evidence is None or isinstance(evidence, (_text_types, Evidence)):
+        return evidence
+    return Evidence(evidence)
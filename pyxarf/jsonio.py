@@ -0,0 +1,149 @@
+'''
+:copyright: (c) 2014 by abusix GmbH
+:license: Apache2, see LICENSE.txt for more details.
+
+json serialization with a choice of backends. the standard library is
+used unless another backend is selected with :py:func:`set_json_backend`,
+as orjson and ujson write compact json without spaces.
+
+'''
+import io
+
+from .exceptions import GeneralError
+
+# backends tried by set_json_backend('auto'), fastest first
+JSON_BACKENDS = ('orjson', 'ujson', 'json')
+
+_backend = None
+
+
+class _JsonBackend(object):
+    '''
+    json serializer returning text and bytes
+
+    :param name: name of the backend module
+    :type name: string
+
+    :raises: :py:class:`ImportError`: if the module is not installed
+    :raises: :py:class:`GeneralError`: if the backend is unknown
+    '''
+    def __init__(self, name):
+        self.name = name
+
+        if name == 'orjson':
+            import orjson
+            self.dumps_bytes = orjson.dumps
+            self.dumps = lambda obj: orjson.dumps(obj).decode('utf-8')
+        elif name == 'ujson':
+            import ujson
+            self.dumps = lambda obj: ujson.dumps(
+                obj, escape_forward_slashes=False
+            )
+            self.dumps_bytes = lambda obj: self.dumps(obj).encode('utf-8')
+        elif name == 'json':
+            import json
+            self.dumps = json.dumps
+            self.dumps_bytes = lambda obj: json.dumps(obj).encode('utf-8')
+        else:
+            raise GeneralError('unknown json backend: %s' % name)
+
+
+def set_json_backend(name='auto'):
+    '''
+    selects the json backend of :py:func:`dumps`, :py:func:`dump_many`
+    and :py:func:`pyxarf.Xarf.to_json`
+
+    :param name: orjson, ujson, json or auto for the fastest installed
+    :type name: string
+
+    :returns: name of the selected backend
+    :rtype: string
+
+    :raises: :py:class:`ImportError`: if the backend is not installed
+    :raises: :py:class:`GeneralError`: if the backend is unknown
+
+    '''
+    global _backend
+
+    if name != 'auto':
+        _backend = _JsonBackend(name)
+        return _backend.name
+
+    for candidate in JSON_BACKENDS:
+        try:
+            _backend = _JsonBackend(candidate)
+        except ImportError:
+            continue
+        return _backend.name
+
+
+def get_json_backend():
+    '''
+    returns the name of the selected json backend
+
+    :rtype: string
+
+    '''
+    return _get_backend().name
+
+
+def _get_backend():
+    if _backend is None:
+        set_json_backend('json')
+    return _backend
+
+
+def dumps(obj, as_bytes=False):
+    '''
+    returns obj as json
+
+    :param obj: data to serialize
+    :type obj: dict
+    :param as_bytes: return utf-8 encoded bytes instead of text
+    :type as_bytes: bool
+
+    :rtype: string or bytes
+
+    '''
+    if as_bytes:
+        return _get_backend().dumps_bytes(obj)
+    return _get_backend().dumps(obj)
+
+
+def dump_many(reports, fp, part=None, batch=256):
+    '''
+    writes reports as newline delimited json, one report per line
+
+    :param reports: xarf objects or report records
+    :type reports: iterable of :py:class:`pyxarf.Xarf` or
+        :py:class:`pyxarf.report.XarfReport`
+    :param fp: text or binary file object
+    :type fp: file
+    :param part: X-ARF object part machine_readable or evidence
+    :type part: str
+    :param batch: number of lines written at once
+    :type batch: int
+
+    :returns: number of written reports
+    :rtype: int
+
+    '''
+    backend = _get_backend()
+    if isinstance(fp, io.TextIOBase):
+        (dumps, newline, join) = (backend.dumps, u'\n', u''.join)
+    else:
+        (dumps, newline, join) = (backend.dumps_bytes, b'\n', b''.join)
+
+    count = 0
+    lines = []
+    for report in reports:
+        lines.append(dumps(report.get_report_obj(part)))
+        lines.append(newline)
+        count += 1
+        if len(lines) >= 2 * batch:
+            fp.write(join(lines))
+            lines = []
+
+    if lines:
+        fp.write(join(lines))
+    return count
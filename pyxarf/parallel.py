@@ -0,0 +1,148 @@
+'''
+:copyright: (c) 2014 by abusix GmbH
+:license: Apache2, see LICENSE.txt for more details.
+
+validation of large report batches on all cores. the schema is sent to
+each worker process once, the reports follow as chunks of key and value
+tuples; reports sharing their keys share one key tuple, which pickle
+writes only once per chunk.
+
+'''
+from itertools import chain
+
+from .exceptions import MissingParameterError
+from .registry import SchemaEntry, default_registry
+from .report import XarfReport
+from .xarf import Xarf
+
+# schema entry of a worker process, set by _init_worker
+_entry = None
+
+
+def _init_worker(url, schema, required_keys):
+    global _entry
+    _entry = SchemaEntry(url, schema, required_keys)
+
+
+def _validate_chunk(rows):
+    return _validate_rows(_entry, rows)
+
+
+def _validate_rows(entry, rows):
+    '''
+    returns the error messages of each key and value tuple in rows
+    '''
+    errors = entry.errors
+    return [errors(dict(zip(keys, values))) for (keys, values) in rows]
+
+
+def _get_schema_url(report):
+    '''
+    returns the schema url of a report dict, xarf object or record
+    '''
+    if hasattr(report, 'schema_url'):
+        return report.schema_url
+    return report.get('Schema-URL')
+
+
+def _get_row(entry, report):
+    '''
+    returns the interned keys and the values of a report dict, xarf
+    object or record
+    '''
+    if isinstance(report, XarfReport):
+        return (report.keys, report.values)
+
+    machine_readable = getattr(report, 'machine_readable', report)
+    return (
+        entry.intern_keys(tuple(machine_readable)),
+        tuple(machine_readable.values()),
+    )
+
+
+def _iter_chunks(entry, reports, chunksize):
+    chunk = []
+    for report in reports:
+        chunk.append(_get_row(entry, report))
+        if len(chunk) >= chunksize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def validate_many(
+    reports,
+    processes=None,
+    schema_url=None,
+    schema_cache=None,
+    registry=None,
+    chunksize=1000,
+):
+    '''
+    validates the machine readable part of many reports in a pool of
+    worker processes. all reports are validated against the schema of
+    schema_url, or of the first report if not given.
+
+    :param reports: machine readable dicts, xarf objects or records
+    :type reports: iterable of dict, :py:class:`pyxarf.Xarf` or
+        :py:class:`pyxarf.report.XarfReport`
+    :param processes: number of worker processes, defaults to the
+        number of cores; 1 validates in the calling process
+    :type processes: int
+    :param schema_url: url of json schema
+    :type schema_url: string
+    :param schema_cache: path where to cache schemas
+    :type schema_cache: string
+    :param registry: schema registry, defaults to the process-wide one
+    :type registry: :py:class:`pyxarf.registry.SchemaRegistry`
+    :param chunksize: number of reports sent to a worker at once
+    :type chunksize: int
+
+    :returns: error messages of each report in order of reports, empty
+        for valid reports
+    :rtype: list of lists
+
+    :raises: :py:class:`MissingParameterError`: if no schema url is given
+    :raises: :py:class:`GeneralError`: if the schema could not be loaded
+
+    '''
+    if registry is None:
+        registry = default_registry
+
+    reports = iter(reports)
+    if not schema_url:
+        for first in reports:
+            schema_url = _get_schema_url(first)
+            reports = chain((first,), reports)
+            break
+        else:
+            return []
+    if not schema_url:
+        raise MissingParameterError('no schema url defined', ['schema_url'])
+
+    entry = registry.get(schema_url, schema_cache, Xarf.http_headers)
+    chunks = _iter_chunks(entry, reports, chunksize)
+
+    if processes is None:
+        from multiprocessing import cpu_count
+        processes = cpu_count()
+
+    if processes <= 1:
+        return list(chain.from_iterable(
+            _validate_rows(entry, chunk) for chunk in chunks
+        ))
+
+    from multiprocessing import Pool
+    pool = Pool(
+        processes, _init_worker,
+        (entry.url, entry.schema, entry.required_keys),
+    )
+    try:
+        results = list(chain.from_iterable(
+            pool.imap(_validate_chunk, chunks)
+        ))
+    finally:
+        pool.terminate()
+        pool.join()
+    return results
@@ -0,0 +1,720 @@
+'''
+:copyright: (c) 2014 by abusix GmbH
+:license: Apache2, see LICENSE.txt for more details.
+
+process-wide registry of downloaded and converted x-arf schemas
+
+'''
+import logging
+import threading
+
+from collections import OrderedDict
+from json import loads as json_loads
+from time import time
+from .cache import SchemaCache
+from .exceptions import GeneralError
+
+_logger = logging.getLogger(__name__)
+
+
+def download_schema(
+    schema_url,
+    schema_cache=None,
+    headers=None,
+    session=None,
+    timeout=None,
+    cache_ttl=None,
+):
+    '''
+    downloads and reads schema from given url or path and returns
+    it as dict. cached schemas older than cache_ttl are revalidated
+    with a conditional request, so unchanged schemas are not
+    downloaded again. if revalidation fails the cached copy is used
+    without asking the server again for the retry_ttl of the cache.
+
+    downloads into the cache hold a lock on the schema file, so
+    processes sharing the cache fetch each schema only once. while a
+    stale copy is revalidated, other processes use it instead of
+    waiting for the lock.
+
+    :param schema_url: url to get schema from
+    :type schema_url: string
+    :param schema_cache: path where to cache schemas
+    :type schema_cache: string
+    :param headers: http headers sent with the download request
+    :type headers: dict
+    :param session: http session to download with, reusing connections
+    :type session: :py:class:`requests.Session`
+    :param timeout: download timeout in seconds
+    :type timeout: float
+    :param cache_ttl: seconds until a cached schema gets revalidated,
+        None to use cached schemas forever
+    :type cache_ttl: float
+
+    :returns: json schema from download or schema cache
+    :rtype: dict
+
+    :raises: :py:class:`GeneralError`: if cache access failed
+    :raises: :py:class:`GeneralError`: if download of schema failed
+    :raises: :py:class:`GeneralError`: if serialization failed
+
+    '''
+    schema_file = schema_url.rpartition('/')[-1]
+
+    if not schema_cache:
+        (schema, meta, modified) = _fetch_schema(
+            schema_url, None, {}, headers, session, timeout
+        )
+        return _parse_schema(schema)
+
+    cache = SchemaCache(schema_cache, cache_ttl)
+    (schema, meta) = _read_cache(cache, schema_file)
+
+    if schema is None or not cache.is_fresh(meta):
+        try:
+            lock = cache.lock(schema_file, blocking=schema is None)
+        except Exception as error:
+            raise GeneralError(
+                'could not lock schema cache: %s' % error
+            )
+
+        with lock as locked:
+            if not locked:
+                # another process is revalidating the stale copy
+                return _parse_schema(schema)
+
+            # another process may have fetched it while we were waiting
+            (schema, meta) = _read_cache(cache, schema_file)
+
+            if schema is None or not cache.is_fresh(meta):
+                old_meta = meta
+                (schema, meta, modified) = _fetch_schema(
+                    schema_url, schema, meta, headers, session, timeout
+                )
+                _write_cache(
+                    cache, schema_file, schema, meta or old_meta, modified,
+                    failed=meta is None,
+                )
+
+    return _parse_schema(schema)
+
+
+def _read_cache(cache, schema_file):
+    '''
+    reads a schema and its metadata from the schema cache
+
+    :param cache: schema cache
+    :type cache: :py:class:`pyxarf.cache.SchemaCache`
+    :param schema_file: file name of schema
+    :type schema_file: string
+
+    :returns: schema text or None if not cached, and metadata
+    :rtype: tuple
+
+    :raises: :py:class:`GeneralError`: if cache access failed
+
+    '''
+    try:
+        (schema, meta) = cache.read(schema_file)
+    except Exception as error:
+        raise GeneralError(
+            'could not get schema from cache: %s' % error
+        )
+
+    if schema is not None:
+        _logger.debug(
+            'got schema from cache: %s', cache.get_path(schema_file)
+        )
+    return (schema, meta)
+
+
+def _write_cache(cache, schema_file, schema, meta, modified, failed=False):
+    '''
+    stores a fetched schema in the schema cache. only the metadata is
+    written if the cached schema did not change, or the failed
+    revalidation if it could not be fetched.
+
+    :param cache: schema cache
+    :type cache: :py:class:`pyxarf.cache.SchemaCache`
+    :param schema_file: file name of schema
+    :type schema_file: string
+    :param schema: schema text
+    :type schema: string
+    :param meta: metadata of schema
+    :type meta: dict
+    :param modified: whether the schema text changed
+    :type modified: bool
+    :param failed: whether the revalidation of the cached schema failed
+    :type failed: bool
+
+    :raises: :py:class:`GeneralError`: if cache access failed
+
+    '''
+    try:
+        if failed:
+            cache.write_failure(schema_file, meta)
+        elif modified:
+            cache.write(schema_file, schema, meta)
+        else:
+            cache.write_meta(schema_file, meta)
+    except Exception as error:
+        raise GeneralError(
+            'could not write schema to cache: %s' % error
+        )
+
+
+def _fetch_schema(schema_url, schema, meta, headers, session, timeout):
+    '''
+    downloads a schema. if a cached schema is given, it gets
+    revalidated with a conditional request and is kept if it did not
+    change or the server could not be reached.
+
+    :param schema_url: url to get schema from
+    :type schema_url: string
+    :param schema: cached schema text or None
+    :type schema: string
+    :param meta: metadata of cached schema
+    :type meta: dict
+    :param headers: http headers sent with the download request
+    :type headers: dict
+    :param session: http session to download with
+    :type session: :py:class:`requests.Session`
+    :param timeout: download timeout in seconds
+    :type timeout: float
+
+    :returns: schema text, new metadata and whether the schema
+        changed. metadata is None if the cached schema was kept
+        because of an error
+    :rtype: tuple
+
+    :raises: :py:class:`GeneralError`: if download of schema failed
+
+    '''
+    # requests is slow to import and not needed for cached schemas
+    import requests
+
+    request_headers = dict(headers or {})
+    if schema is not None:
+        if meta.get('etag'):
+            request_headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            request_headers['If-Modified-Since'] = meta['last_modified']
+
+    try:
+        _logger.debug('downloading schema %s', schema_url)
+        response = (session or requests).get(
+            schema_url, headers=request_headers, timeout=timeout
+        )
+        if response.status_code != 304:
+            response.raise_for_status()
+    except Exception as error:
+        if schema is None:
+            raise GeneralError(
+                'could not download schema: %s' % error
+            )
+        _logger.warning(
+            'could not revalidate schema %s, using cached copy: %s',
+            schema_url, error
+        )
+        return (schema, None, False)
+
+    modified = response.status_code != 304
+    if modified:
+        schema = response.text
+        _logger.debug('downloaded schema: %s', schema)
+    else:
+        _logger.debug('cached schema is up to date')
+
+    meta = {
+        'etag': response.headers.get('ETag', meta.get('etag')),
+        'last_modified': response.headers.get(
+            'Last-Modified', meta.get('last_modified')
+        ),
+        'fetched': time(),
+    }
+    return (schema, meta, modified)
+
+
+def _parse_schema(schema):
+    '''
+    parses the schema text
+
+    :param schema: schema text
+    :type schema: string
+
+    :returns: json schema
+    :rtype: dict
+
+    :raises: :py:class:`GeneralError`: if serialization failed
+
+    '''
+    try:
+        return json_loads(schema)
+    except Exception as error:
+        raise GeneralError(
+            'could not serialize schema: %s' % error
+        )
+
+
+def convert_schema(schema):
+    '''
+    converts given schema from draft02 to draft03 as jsonschema
+    does not support draft02.
+
+    :param schema: schema to convert, gets modified in place
+    :type schema: dict
+
+    :returns: converted schema and required keys
+    :rtype: tuple
+
+    '''
+    required_keys = {}
+
+    if 'properties' in schema:
+        props = schema['properties']
+
+        for item in props:
+            if item == 'User-Agent':
+                continue
+            if 'requires' in props[item]:
+                props[item]['dependencies'] = props[item]['requires']
+                del props[item]['requires']
+            if 'optional' not in props[item]:
+                props[item]['required'] = True
+                required_keys[str(item)] = ''
+            else:
+                del props[item]['optional']
+
+    return (schema, required_keys)
+
+
+class SchemaEntry(object):
+    '''
+    converted schema together with its required keys template, a
+    draft03 validator and a compiled check function, which are built
+    on first use
+
+    :param url: url of json schema
+    :type url: string
+    :param schema: converted json schema
+    :type schema: dict
+    :param required_keys: required keys mapped to empty values
+    :type required_keys: dict
+
+    '''
+    __slots__ = (
+        'url', 'schema', 'required_keys', '_validator', '_checker',
+        '_partial_checkers', '_param_keys', '_param_names', '_key_tuples'
+    )
+
+    def __init__(self, url, schema, required_keys):
+        self.url = url
+        self.schema = schema
+        self.required_keys = required_keys
+        self._validator = None
+        self._checker = None
+        self._partial_checkers = {}
+        self._param_keys = None
+        self._param_names = None
+        self._key_tuples = {}
+
+    @property
+    def validator(self):
+        '''
+        draft03 validator of the schema
+
+        :rtype: :py:class:`jsonschema.validators.Draft3Validator`
+
+        '''
+        if self._validator is None:
+            # jsonschema is slow to import, load it on first validation
+            from jsonschema.validators import Draft3Validator
+            self._validator = Draft3Validator(self.schema)
+        return self._validator
+
+    @property
+    def checker(self):
+        '''
+        check function compiled from the schema, see
+        :py:func:`pyxarf.compiled.compile_schema`, or None if the schema
+        can only be checked by the validator
+
+        :rtype: function
+
+        '''
+        if self._checker is None:
+            from .compiled import compile_schema
+            self._checker = compile_schema(self.schema) or False
+        return self._checker or None
+
+    def errors(self, machine_readable, keys=None):
+        '''
+        validates machine readable data against the schema, with the
+        compiled check function if it supports the schema and data, with
+        the validator otherwise. if keys are given and the schema is
+        compiled, only these keys and the keys related to them by
+        dependencies are checked.
+
+        :param machine_readable: xarf machine readable part
+        :type machine_readable: dict
+        :param keys: machine readable keys to check
+        :type keys: iterable
+
+        :returns: error messages, empty if the data is valid
+        :rtype: list
+
+        '''
+        if keys is None:
+            checker = self.checker
+        else:
+            checker = self._get_partial_checker(frozenset(keys))
+        if checker is not None:
+            errors = checker(machine_readable)
+            if errors is not None:
+                return errors
+
+        return [
+            '%s %s' % (error.path[0], error.message)
+            for error in self.validator.iter_errors(machine_readable)
+        ]
+
+    def _get_partial_checker(self, keys):
+        '''
+        returns the check function of the properties keys and their
+        dependencies, or None if the schema is not compiled
+        '''
+        if self.checker is None:
+            return None
+
+        checker = self._partial_checkers.get(keys)
+        if checker is None:
+            from .compiled import compile_schema
+            related = self._get_related_keys(keys)
+            properties = self.schema.get('properties', {})
+            schema = dict(self.schema)
+            schema['properties'] = dict(
+                (key, properties[key]) for key in properties if key in related
+            )
+            checker = compile_schema(schema)
+            self._partial_checkers[keys] = checker
+        return checker
+
+    def _get_related_keys(self, keys):
+        '''
+        returns keys together with the properties depending on them and
+        the properties they depend on
+        '''
+        related = set(keys)
+        for (key, subschema) in self.schema.get('properties', {}).items():
+            dependencies = subschema.get('dependencies', ())
+            if isinstance(dependencies, dict):
+                dependencies = ()
+            elif not isinstance(dependencies, (list, tuple)):
+                dependencies = (dependencies,)
+
+            if key in keys:
+                related.update(dependencies)
+            elif any(dependency in keys for dependency in dependencies):
+                related.add(key)
+        return related
+
+    def get_key(self, name):
+        '''
+        returns the machine readable key of a schema property given as
+        key (``Report-ID``) or as parameter name (``report_id``)
+
+        :param name: key or parameter name
+        :type name: string
+
+        :returns: machine readable key or None if the schema has no
+            such property
+        :rtype: string
+
+        '''
+        if self._param_keys is None:
+            param_keys = {}
+            for key in self.schema.get('properties', {}):
+                param_keys[key] = key
+                param_keys[key.lower().replace('-', '_')] = key
+            self._param_keys = param_keys
+        return self._param_keys.get(name)
+
+    def param_names(self):
+        '''
+        returns the required keys with their parameter names, like
+        ``('Report-ID', 'report_id')``
+
+        :rtype: tuple of tuples
+
+        '''
+        if self._param_names is None:
+            self._param_names = tuple(
+                (key, key.lower().replace('-', '_'))
+                for key in self.required_keys
+            )
+        return self._param_names
+
+    def new_required_keys(self):
+        '''
+        returns a fresh copy of the required keys template, which is
+        safe to fill with report values
+
+        :returns: required keys mapped to empty values
+        :rtype: dict
+
+        '''
+        return dict(self.required_keys)
+
+    def intern_keys(self, keys):
+        '''
+        returns the shared instance of the given key tuple, so reports
+        of this schema with the same keys do not each hold a copy
+
+        :param keys: machine readable keys
+        :type keys: tuple
+
+        :returns: shared key tuple
+        :rtype: tuple
+
+        '''
+        return self._key_tuples.setdefault(keys, keys)
+
+
+class SchemaRegistry(object):
+    '''
+    thread-safe cache of converted schemas keyed by schema url. the
+    least recently used entries get evicted once more than maxsize
+    schemas are held; pinned entries, like those of a schema bundle,
+    are never evicted and do not count towards maxsize. downloads share
+    one keep-alive http session.
+
+    :param maxsize: maximum number of cached unpinned schemas, None for
+        no limit
+    :type maxsize: int
+    :param timeout: download timeout in seconds
+    :type timeout: float
+    :param session: http session to download with
+    :type session: :py:class:`requests.Session`
+    :param cache_ttl: seconds until schemas in a schema cache get
+        revalidated, None to use cached schemas forever
+    :type cache_ttl: float
+
+    '''
+    def __init__(self, maxsize=64, timeout=10, session=None, cache_ttl=86400):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._session = session
+        self._entries = OrderedDict()
+        self._pinned = set()
+        self._lock = threading.Lock()
+        # url -> [lock, number of threads using it]
+        self._url_locks = {}
+        self._pending = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, schema_url):
+        return schema_url in self._entries
+
+    def get(self, schema_url, schema_cache=None, headers=None):
+        '''
+        returns the cached entry for the given schema url, downloading
+        and converting the schema on first use. concurrent callers
+        asking for the same missing schema share a single download.
+
+        :param schema_url: url to get schema from
+        :type schema_url: string
+        :param schema_cache: path where to cache schemas
+        :type schema_cache: string
+        :param headers: http headers sent with the download request
+        :type headers: dict
+
+        :returns: cached schema entry
+        :rtype: :py:class:`SchemaEntry`
+
+        :raises: :py:class:`GeneralError`: if the schema could not be loaded
+
+        '''
+        entry = self._lookup(schema_url)
+        if entry is None:
+            entry = self._get_missing(schema_url, schema_cache, headers)
+        return entry
+
+    def aload(self, schema_url, schema_cache=None, headers=None):
+        '''
+        asyncio variant of :py:func:`get`, the download runs in a
+        thread pool. concurrent callers asking for the same missing
+        schema await the same in-flight download.
+
+        :param schema_url: url to get schema from
+        :type schema_url: string
+        :param schema_cache: path where to cache schemas
+        :type schema_cache: string
+        :param headers: http headers sent with the download request
+        :type headers: dict
+
+        :returns: awaitable resolving to the cached schema entry
+        :rtype: coroutine
+
+        '''
+        # asyncio syntax is only available on python 3
+        from .aio import aload
+        return aload(self, schema_url, schema_cache, headers)
+
+    def load(self, schema_url, schema_cache=None, headers=None):
+        '''
+        downloads and converts the given schema without caching it
+
+        :param schema_url: url to get schema from
+        :type schema_url: string
+        :param schema_cache: path where to cache schemas
+        :type schema_cache: string
+        :param headers: http headers sent with the download request
+        :type headers: dict
+
+        :returns: new schema entry
+        :rtype: :py:class:`SchemaEntry`
+
+        '''
+        with self._lock:
+            if self._session is None:
+                import requests
+                self._session = requests.Session()
+
+        (schema, required_keys) = convert_schema(download_schema(
+            schema_url,
+            schema_cache,
+            headers,
+            self._session,
+            self.timeout,
+            self.cache_ttl,
+        ))
+        return SchemaEntry(schema_url, schema, required_keys)
+
+    def add(self, entry, pin=False):
+        '''
+        stores the given entry, evicting the least recently used
+        unpinned ones if the registry is full
+
+        :param entry: schema entry to store
+        :type entry: :py:class:`SchemaEntry`
+        :param pin: keep the entry until :py:func:`clear` is called
+        :type pin: bool
+
+        '''
+        with self._lock:
+            self._entries.pop(entry.url, None)
+            self._entries[entry.url] = entry
+            if pin:
+                self._pinned.add(entry.url)
+
+            while self.maxsize and \
+                    len(self._entries) - len(self._pinned) > self.maxsize:
+                for schema_url in self._entries:
+                    if schema_url not in self._pinned:
+                        break
+                del self._entries[schema_url]
+                self.evictions += 1
+
+    def clear(self):
+        '''
+        drops all cached schemas and resets the counters
+
+        '''
+        with self._lock:
+            self._entries.clear()
+            self._pinned.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        '''
+        returns usage counters of the registry
+
+        :returns: hits, misses, evictions, current size and number of
+            pinned entries
+        :rtype: dict
+
+        '''
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'pinned': len(self._pinned),
+            }
+
+    def _get_missing(self, schema_url, schema_cache=None, headers=None):
+        '''
+        loads and stores a schema which was not found in the registry,
+        making sure it is only loaded once at a time
+
+        :param schema_url: url to get schema from
+        :type schema_url: string
+        :param schema_cache: path where to cache schemas
+        :type schema_cache: string
+        :param headers: http headers sent with the download request
+        :type headers: dict
+
+        :returns: cached schema entry
+        :rtype: :py:class:`SchemaEntry`
+
+        '''
+        # the lock of an url is shared until its last user is done, also
+        # if loading failed, so threads arriving later wait for the same
+        # lock instead of downloading in parallel
+        with self._lock:
+            users = self._url_locks.get(schema_url)
+            if users is None:
+                users = self._url_locks[schema_url] = [threading.Lock(), 0]
+            users[1] += 1
+
+        try:
+            with users[0]:
+                # another thread may have loaded it while we were waiting
+                entry = self._lookup(schema_url, count=False)
+                if entry is None:
+                    entry = self.load(schema_url, schema_cache, headers)
+                    self.add(entry)
+        finally:
+            with self._lock:
+                users[1] -= 1
+                if not users[1]:
+                    del self._url_locks[schema_url]
+
+        return entry
+
+    def _lookup(self, schema_url, count=True):
+        '''
+        returns the cached entry and marks it as recently used
+
+        :param schema_url: url of json schema
+        :type schema_url: string
+        :param count: whether to update the hit and miss counters
+        :type count: bool
+
+        :returns: cached schema entry or None
+        :rtype: :py:class:`SchemaEntry`
+
+        '''
+        with self._lock:
+            entry = self._entries.pop(schema_url, None)
+
+            if entry is None:
+                if count:
+                    self.misses += 1
+                return None
+
+            self._entries[schema_url] = entry
+            if count:
+                self.hits += 1
+            return entry
+
+
+default_registry = SchemaRegistry()
@@ -0,0 +1,76 @@
+'''
+:copyright: (c) 2014 by abusix GmbH
+:license: Apache2, see LICENSE.txt for more details.
+
+compact report records for keeping many reports in memory
+
+'''
+
+
+class XarfReport(object):
+    '''
+    validated xarf report reduced to its data. all records of one
+    schema share the schema entry and, as long as they have the same
+    machine readable keys, the key tuple; each record only holds its
+    own values.
+
+    :param entry: schema entry the report was validated against
+    :type entry: :py:class:`pyxarf.registry.SchemaEntry`
+    :param machine_readable: xarf machine readable part
+    :type machine_readable: dict
+    :param evidence: raw evidence data
+    :type evidence: string
+
+    '''
+    __slots__ = ('entry', 'keys', 'values', 'evidence')
+
+    def __init__(self, entry, machine_readable, evidence=None):
+        self.entry = entry
+        self.keys = entry.intern_keys(tuple(machine_readable))
+        self.values = tuple(machine_readable.values())
+        self.evidence = evidence
+
+    @property
+    def schema_url(self):
+        '''
+        url of the json schema of the report
+
+        :rtype: string
+
+        '''
+        return self.entry.url
+
+    @property
+    def machine_readable(self):
+        '''
+        xarf machine readable part, rebuilt on every access
+
+        :rtype: dict
+
+        '''
+        return dict(zip(self.keys, self.values))
+
+    def get_report_obj(self, part=None):
+        '''
+        returns the report data as python dict, like
+        :py:func:`pyxarf.Xarf.get_report_obj`
+
+        :param part: X-ARF object part machine_readable or evidence
+        :type part: str
+        :returns: xarf report as dict with both parts
+        :rtype: dict
+
+        '''
+        if part == 'machine_readable':
+            return self.machine_readable
+
+        evidence = self.evidence
+        if hasattr(evidence, 'text'):
+            evidence = evidence.text()
+        if part == 'evidence':
+            return evidence
+
+        return {
+            'machine_readable': self.machine_readable,
+            'evidence': evidence,
+        }
@@ -8,23 +8,31 @@ for more information see: https://docs.abusix.com/pyxarf/
 
 '''
 import logging
-import requests
 
-from os.path import isfile
-from yaml import dump as yaml_dumps
-from json import dumps as json_dumps, loads as json_loads
-from jsonschema.validators import Draft3Validator
-from .exceptions import GeneralError, MissingParameterError, ValidationError
+from collections import namedtuple
+from .exceptions import GeneralError, MissingParameterError, \
+    ValidationError
+from .jsonio import dumps as json_dumps
+from .emitter import dump_flat_mapping, dump_yaml
+from .evidence import Evidence, as_evidence
+from .registry import convert_schema, default_registry, download_schema
+from .report import XarfReport
 
 __version__ = '0.0.5'
 __useragent__ = 'pyxarf %s' % (__version__)
 
+_logger = logging.getLogger(__name__)
+
+# outcome of building a single row with :py:func:`Xarf.iter_many`
+BuildResult = namedtuple('BuildResult', ('index', 'report', 'output', 'error'))
+
 class Xarf(object):
     '''
     xarf report generation class
 
-    :param evidence: raw evidence data
-    :type evidence: string
+    :param evidence: raw evidence data, or a file object or buffer
+        read only when the evidence is used
+    :type evidence: string, file or memoryview
     :param reported_from: source of report
     :type reported_from: string
     :param category: category of report
@@ -45,6 +53,8 @@ class Xarf(object):
     :type schema_url: string
     :param schema_cache: path where to cache schemas
     :type schema_cache: string
+    :param registry: schema registry, defaults to the process-wide one
+    :type registry: :py:class:`pyxarf.registry.SchemaRegistry`
     :param kwargs: schema dependant additional parameters
     :type kwargs: dict
 
@@ -69,13 +79,15 @@ class Xarf(object):
 
     def _debug(self, *messages):
         '''
-        prints debug message on stdout
+        logs debug message, the messages are only formatted if debug
+        logging is enabled
 
         :param messages: messages to log
         :type messages: tuple
 
         '''
-        self._logger.debug(' '.join([str(x) for x in messages]))
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug(' '.join([str(x) for x in messages]))
 
     def __init__(
         self,
@@ -90,6 +102,7 @@ class Xarf(object):
         attachment=None,
         schema_url=None,
         schema_cache=None,
+        registry=None,
         **kwargs
     ):
         '''
@@ -97,48 +110,37 @@ class Xarf(object):
         full xarf reports as dict passed to param machine_readable
 
         '''
-        self._logger = self._setup_logging()
-
         self.user_agent = __useragent__
-        self._required_keys = {}
 
         self.machine_readable = None
-        self.evidence = evidence
+        self._validated = None
+        self.evidence = as_evidence(evidence)
         self.schema_url = schema_url
         self.schema_cache = schema_cache
+        self.registry = default_registry if registry is None else registry
 
-        (self.schema, self._required_keys) = self._get_schema_and_keys(
+        self._schema_entry = self._get_schema_entry(
             self._get_schema_url(self.machine_readable)
         )
+        self.schema = self._schema_entry.schema
+        self._required_keys = self._schema_entry.new_required_keys()
         self._build_machine_readable(locals(), kwargs)
 
-    def _setup_logging(self):
-        '''
-        setup basic logging configuration
-
-        :returns: logger object
-        :rtype: object
-
-        '''
-        logging.basicConfig(
-            format='%(asctime)s %(name)s %(levelname)s - %(message)s'
-        )
-        return logging.getLogger(__name__)
-
-    def _get_schema_and_keys(self, schema_url):
+    def _get_schema_entry(self, schema_url):
         '''
-        download and convert from draft02 to draft03, also write all
-        required keys to self._required_keys
+        get the converted draft03 schema with its required keys and
+        compiled validator from the schema registry, which downloads
+        it on first use
 
         :param schema_url: url to get schema from
         :type schema_url: string
 
-        :returns: output of :py:func:`_schema_converter`
-        :rtype: tuple
+        :returns: schema entry
+        :rtype: :py:class:`pyxarf.registry.SchemaEntry`
 
         '''
-        return self._schema_converter(
-            self._download_schema(schema_url)
+        return self.registry.get(
+            schema_url, self.schema_cache, self.http_headers
         )
 
     def _get_schema_url(self, machine_readable=None):
@@ -207,7 +209,7 @@ class Xarf(object):
     def _download_schema(self, schema_url):
         '''
         downloads and reads schema from given url or path and returns
-        it as dict
+        it as dict, see :py:func:`pyxarf.registry.download_schema`
 
         :param schema_url: url to get schema from
         :type schema_url: string
@@ -215,59 +217,18 @@ class Xarf(object):
         :returns: json schema from download or schema cache
         :rtype: dict
 
-        :raises: :py:class:`GeneralError`: if cache access failed
-        :raises: :py:class:`GeneralError`: if download of schema failed
-        :raises: :py:class:`GeneralError`: if serialization failed
-
         '''
-        schema_file = schema_url.rpartition('/')[-1]
-        full_path = ''
-        schema = None
-
-        try:
-            if self.schema_cache:
-                full_path = '%s/%s' % (
-                    self.schema_cache.rstrip('/'), schema_file
-                )
-
-                if isfile(full_path):
-                    self._debug('getting schema from cache:', full_path)
-
-                    with open(full_path, 'r') as f:
-                        schema = f.read()
-
-                    self._debug('got schema from file:', schema)
-        except Exception as error:
-            raise GeneralError(
-                'could not get schema from cache: %s' % error
-            )
-
-        if not schema:
-            try:
-                self._debug('downloading schema', schema_url)
-                response = requests.get(schema_url, headers=self.http_headers)
-                schema = response.text
-
-                self._debug('downloaded schema:', schema)
-            except Exception as error:
-                raise GeneralError(
-                    'could not download schema: %s' % error
-                )
-
-        if self.schema_cache:
-            with open(full_path, 'w') as f:
-                f.write(schema)
-        try:
-            return json_loads(schema)
-        except Exception as error:
-            raise GeneralError(
-                'could not serialize schema: %s' % error
-            )
+        return download_schema(
+            schema_url, self.schema_cache, self.http_headers
+        )
 
     def _validate_schema(self, schema, machine_readable):
         '''
         validates given machine_readable data against given schema
-        with jsonschema draft03 validator.
+        with jsonschema draft03 validator. the report schema is checked
+        by its compiled check function if it supports the schema and
+        data, by its reused validator otherwise; other schemas get
+        compiled on the fly.
 
         :param schema: json schema to check against
         :type schema: dict
@@ -277,13 +238,15 @@ class Xarf(object):
         :raises: :py:class:`ValidationError`: if validation fails
 
         '''
-        errors = []
-        validator = Draft3Validator(schema)
-        result = validator.iter_errors(machine_readable)
-
-        for error in result:
-            msg = '%s %s' % (error.path[0], error.message)
-            errors.append(msg)
+        if schema is self.schema:
+            errors = self._schema_entry.errors(machine_readable)
+        else:
+            from jsonschema.validators import Draft3Validator
+            validator = Draft3Validator(schema)
+            errors = [
+                '%s %s' % (error.path[0], error.message)
+                for error in validator.iter_errors(machine_readable)
+            ]
 
         if len(errors):
             raise ValidationError(
@@ -302,43 +265,50 @@ class Xarf(object):
         :rtype: tuple
 
         '''
-
-        required_keys = {}
-        self._debug('before conversion:', json_dumps(schema))
-
-        if 'properties' in schema:
-            props = schema['properties']
-
-            for item in props:
-                if item == 'User-Agent':
-                    continue
-                if 'requires' in props[item]:
-                    props[item]['dependencies'] = props[item]['requires']
-                    del props[item]['requires']
-                if 'optional' not in props[item]:
-                    props[item]['required'] = True
-                    required_keys[str(item)] = ''
-                else:
-                    del props[item]['optional']
-
-        self._debug('after conversion:', json_dumps(schema))
-        return (schema, required_keys)
+        return convert_schema(schema)
 
     def _get_validated_machine_readable(self):
         '''
-        validates and returns the machine readable parts
+        validates and returns the machine readable parts. validation
+        is skipped if neither machine_readable nor evidence changed
+        since the last successful validation.
 
         :returns: validated machine readable data
         :rtype: dict
 
         '''
-        self._debug(self.machine_readable)
-        self._validate_schema(
-                self.schema,
-                self.machine_readable
-            )
+        if not self._is_validated():
+            self._debug(self.machine_readable)
+            self._validate_schema(
+                    self.schema,
+                    self.machine_readable
+                )
+            self._validated = (self.evidence, dict(self.machine_readable))
         return self.machine_readable
 
+    def _is_validated(self):
+        '''
+        checks if the current machine_readable and evidence data equal
+        the data of the last successful validation
+
+        :returns: True if the report does not need to be validated again
+        :rtype: bool
+
+        '''
+        if self._validated is None:
+            return False
+
+        (evidence, machine_readable) = self._validated
+        if evidence is not self.evidence or \
+                machine_readable != self.machine_readable:
+            return False
+
+        # 1 == True and 1 == 1.0, but the schema types tell them apart
+        for key, value in self.machine_readable.items():
+            if type(value) is not type(machine_readable[key]):
+                return False
+        return True
+
     def __str__(self):
         '''
         method for convinient usage
@@ -349,17 +319,20 @@ class Xarf(object):
         '''
         return self.to_json()
 
-    def to_json(self, part=None):
+    def to_json(self, part=None, as_bytes=False):
         '''
-        returns data as json
+        returns data as json, written by the backend selected with
+        :py:func:`pyxarf.jsonio.set_json_backend`
 
         :param part: X-ARF object part machine_readable or evidence
         :type part: str
+        :param as_bytes: return utf-8 encoded bytes instead of text
+        :type as_bytes: bool
         :returns: json dump of xarf report
         :rtype: json
 
         '''
-        return json_dumps(self.get_report_obj(part))
+        return json_dumps(self.get_report_obj(part), as_bytes)
 
     def to_yaml(self, part=None):
         '''
@@ -371,9 +344,15 @@ class Xarf(object):
         :rtype: yaml
 
         '''
-        return yaml_dumps(
-            self.get_report_obj(part), default_flow_style=False
-        )
+        data = self.get_report_obj(part)
+
+        # the flat machine readable part is written without yaml
+        if part == 'machine_readable':
+            output = dump_flat_mapping(data)
+            if output is not None:
+                return output
+
+        return dump_yaml(data)
 
     def get_report_obj(self, part=None):
         '''
@@ -389,25 +368,133 @@ class Xarf(object):
             if part == 'machine_readable':
                 return self._get_validated_machine_readable()
             elif part == 'evidence':
-                return self.evidence
+                return self._get_evidence_text()
 
         return {
             'machine_readable': self._get_validated_machine_readable(),
-            'evidence': self.evidence,
+            'evidence': self._get_evidence_text(),
         }
 
-    def add_evidence(self, evidence):
+    def _get_evidence_text(self):
         '''
-        add evidence to xarf report
+        returns the evidence as text, reading evidence kept by reference
 
-        :param evidence: raw evidence data
-        :type evidence: string
+        :rtype: string
+        '''
+        if isinstance(self.evidence, Evidence):
+            return self.evidence.text()
+        return self.evidence
 
+    def add_evidence(self, evidence=None, path=None):
         '''
+        add evidence to xarf report. file objects, buffers and files
+        given by path are kept by reference and only read when the
+        report is rendered, see :py:class:`pyxarf.evidence.Evidence`
+
+        :param evidence: raw evidence data, file object or buffer
+        :type evidence: string, file or memoryview
+        :param path: path of a file holding the evidence
+        :type path: string
+
+        '''
+        self.evidence = as_evidence(evidence, path)
+
+    def update(self, **fields):
+        '''
+        changes report fields in place. if the report was valid before,
+        only the changed fields and the fields related to them by
+        dependencies are validated again, otherwise the report gets
+        validated in full when it is used next. the report is left
+        unchanged if validation fails. removing the evidence sets the
+        attachment to ``none`` like the constructor does, unless an
+        attachment is given as well.
+
+        :param fields: new values by parameter name (``report_id``) or
+            machine readable key (``Report-ID``), and the ``evidence``
+        :type fields: dict
+
+        :returns: the report
+        :rtype: :py:class:`Xarf`
+
+        :raises: :py:class:`ValidationError`: if a field is not in the
+            schema or validation fails
+
+        '''
+        evidence = self.evidence
+        removes_evidence = False
+        if 'evidence' in fields:
+            evidence = as_evidence(fields.pop('evidence'))
+            removes_evidence = not evidence
+
+        changes = {}
+        unknown = []
+        for name, value in fields.items():
+            key = self._schema_entry.get_key(name)
+            if key is None:
+                unknown.append(name)
+            else:
+                changes[key] = value
+        if unknown:
+            raise ValidationError(
+                'unknown parameter(s): %s' % ', '.join(sorted(unknown))
+            )
+        if removes_evidence and 'Attachment' not in changes:
+            changes['Attachment'] = 'none'
+
+        if self._is_validated():
+            machine_readable = dict(self.machine_readable)
+            machine_readable.update(changes)
+            errors = self._schema_entry.errors(machine_readable, changes)
+            if errors:
+                raise ValidationError(', '.join(errors))
+            self._validated = (evidence, machine_readable)
+
+        self.machine_readable.update(changes)
         self.evidence = evidence
+        return self
+
+    def copy_with(self, **fields):
+        '''
+        returns a copy of the report with changed fields, see
+        :py:func:`update`. the copy shares the schema and the evidence
+        with the report and skips validation of unchanged fields.
+
+        :param fields: new values by parameter name or machine readable
+            key, and the ``evidence``
+        :type fields: dict
+
+        :returns: changed copy of the report
+        :rtype: :py:class:`Xarf`
+
+        :raises: :py:class:`ValidationError`: if a field is not in the
+            schema or validation fails
+
+        '''
+        report = self.__class__.__new__(self.__class__)
+        report.__dict__.update(self.__dict__)
+        report.machine_readable = dict(self.machine_readable)
+        report._required_keys = report.machine_readable
+        return report.update(**fields)
+
+    def to_record(self):
+        '''
+        returns the validated report as compact record for keeping
+        large numbers of reports in memory
+
+        :returns: report record
+        :rtype: :py:class:`pyxarf.report.XarfReport`
+
+        :raises: :py:class:`ValidationError`: if validation fails
+
+        '''
+        return XarfReport(
+            self._schema_entry,
+            self._get_validated_machine_readable(),
+            self.evidence,
+        )
 
     @classmethod
-    def from_machine_readable(cls, machine_readable, evidence=None):
+    def from_machine_readable(cls, machine_readable, evidence=None, **kwargs):
         '''
         xarf factory to create xarf object from dict.
 
@@ -415,6 +502,8 @@ class Xarf(object):
         :type machine_readable: dict
         :param evidence: raw evidence data
         :type evidence: string
+        :param kwargs: additional parameters like schema_cache or registry
+        :type kwargs: dict
 
         :returns: instance of :py:class:`Xarf`
         :rtype: instance
@@ -425,4 +514,223 @@ class Xarf(object):
             valid_key = key.lower().replace('-', '_')
             data[valid_key] = machine_readable[key]
         data['evidence'] = evidence
+        data.update(kwargs)
         return cls(**data)
+
+    @classmethod
+    def acreate(cls, **kwargs):
+        '''
+        asyncio variant of the constructor, the schema is downloaded
+        in a thread pool instead of blocking the event loop.
+
+        :param kwargs: parameters of :py:class:`Xarf`
+        :type kwargs: dict
+
+        :returns: awaitable resolving to an instance of :py:class:`Xarf`
+        :rtype: coroutine
+
+        '''
+        # asyncio syntax is only available on python 3
+        from .aio import acreate
+        return acreate(cls, **kwargs)
+
+    @classmethod
+    def from_record(cls, record, registry=None):
+        '''
+        xarf factory to create xarf object from a report record. the
+        schema of the record is put back into the registry if it got
+        evicted meanwhile, so it is never downloaded again.
+
+        :param record: report record
+        :type record: :py:class:`pyxarf.report.XarfReport`
+        :param registry: schema registry, defaults to the process-wide one
+        :type registry: :py:class:`pyxarf.registry.SchemaRegistry`
+
+        :returns: instance of :py:class:`Xarf`
+        :rtype: instance
+
+        '''
+        if registry is None:
+            registry = default_registry
+        if record.schema_url not in registry:
+            registry.add(record.entry)
+
+        machine_readable = record.machine_readable
+        report = cls.from_machine_readable(
+            machine_readable, record.evidence, registry=registry
+        )
+        # keep optional keys and skip validation, records are valid
+        report.machine_readable.update(machine_readable)
+        report._validated = (report.evidence, machine_readable)
+        return report
+
+    @classmethod
+    def iter_many(
+        cls,
+        rows,
+        schema_url=None,
+        schema_cache=None,
+        registry=None,
+        output=None,
+    ):
+        '''
+        builds and validates one report per row and yields a
+        :py:class:`BuildResult` for each of them. invalid rows do not
+        stop the iteration, their error is returned in the result; this
+        includes rows whose own schema url could not be loaded. the
+        schema of each url is resolved once and rows are checked
+        against it directly, without going through :py:func:`__init__`.
+
+        rows are dicts of report parameters, either as machine readable
+        keys (``Report-ID``) or as parameter names (``report_id``),
+        optionally containing the ``evidence``.
+
+        :param rows: report parameters
+        :type rows: iterable
+        :param schema_url: url of json schema, if not given per row
+        :type schema_url: string
+        :param schema_cache: path where to cache schemas
+        :type schema_cache: string
+        :param registry: schema registry, defaults to the process-wide one
+        :type registry: :py:class:`pyxarf.registry.SchemaRegistry`
+        :param output: serialize valid reports to 'json' or 'yaml'
+        :type output: string
+
+        :returns: generator of build results
+        :rtype: generator
+
+        :raises: :py:class:`GeneralError`: if the schema of schema_url
+            could not be loaded
+
+        '''
+        if registry is None:
+            registry = default_registry
+
+        serializers = {
+            None: None,
+            'json': cls.to_json,
+            'yaml': cls.to_yaml,
+        }
+        serialize = serializers[output]
+
+        if schema_url:
+            # fail early instead of once per row
+            registry.get(schema_url, schema_cache, cls.http_headers)
+
+        # the schema of each url is resolved once, failures included
+        entries = {}
+        for index, row in enumerate(rows):
+            data = {'schema_url': schema_url}
+            for key in row:
+                data[key.lower().replace('-', '_')] = row[key]
+
+            url = data['schema_url']
+            try:
+                if not url:
+                    raise MissingParameterError(
+                        'no schema url defined', ['schema_url']
+                    )
+                if url not in entries:
+                    try:
+                        entries[url] = registry.get(
+                            url, schema_cache, cls.http_headers
+                        )
+                    except GeneralError as error:
+                        entries[url] = error
+                entry = entries[url]
+                if isinstance(entry, GeneralError):
+                    raise entry
+
+                report = cls._from_row(entry, data, schema_cache, registry)
+            except (
+                GeneralError, MissingParameterError, ValidationError
+            ) as error:
+                yield BuildResult(index, None, None, error)
+                continue
+
+            if serialize:
+                yield BuildResult(index, report, serialize(report), None)
+            else:
+                yield BuildResult(index, report, None, None)
+
+    @classmethod
+    def _from_row(cls, entry, data, schema_cache, registry):
+        '''
+        builds and validates a report from normalized row data like
+        :py:func:`__init__`, with the schema entry already resolved and
+        the row checked by :py:func:`pyxarf.registry.SchemaEntry.errors`
+
+        :param entry: schema entry of the report
+        :type entry: :py:class:`pyxarf.registry.SchemaEntry`
+        :param data: report parameters by parameter name
+        :type data: dict
+
+        :returns: validated report
+        :rtype: :py:class:`Xarf`
+
+        :raises: :py:class:`MissingParameterError`: if a parameter is missing
+        :raises: :py:class:`ValidationError`: if validation fails
+
+        '''
+        evidence = as_evidence(data.get('evidence'))
+        machine_readable = {}
+        missing_parameters = []
+
+        for (key, param) in entry.param_names():
+            if param in data:
+                machine_readable[key] = data[param]
+            elif param in _INIT_PARAMS:
+                # named parameters of __init__ default to None
+                machine_readable[key] = None
+            else:
+                missing_parameters.append(param)
+        if missing_parameters:
+            raise MissingParameterError(
+                'missing required parameter(s): %s' % (
+                    ', '.join(missing_parameters)
+                ), missing_parameters
+            )
+
+        machine_readable['User-Agent'] = __useragent__
+        if not evidence:
+            machine_readable['Attachment'] = 'none'
+
+        errors = entry.errors(machine_readable)
+        if errors:
+            raise ValidationError(', '.join(errors))
+
+        report = cls.__new__(cls)
+        report.user_agent = __useragent__
+        report.evidence = evidence
+        report.schema_url = data['schema_url']
+        report.schema_cache = schema_cache
+        report.registry = registry
+        report._schema_entry = entry
+        report.schema = entry.schema
+        report.missing_parameters = missing_parameters
+        report.machine_readable = report._required_keys = machine_readable
+        report._validated = (evidence, dict(machine_readable))
+        return report
+
+    @classmethod
+    def build_many(cls, rows, schema_url=None, **kwargs):
+        '''
+        builds and validates one report per row, see :py:func:`iter_many`
+        for all parameters
+
+        :param rows: report parameters
+        :type rows: iterable
+        :param schema_url: url of json schema, if not given per row
+        :type schema_url: string
+
+        :returns: build results in order of rows
+        :rtype: list
+
+        '''
+        return list(cls.iter_many(rows, schema_url, **kwargs))
+
+
+# named parameters of Xarf.__init__, which are not missing if not given
+_INIT_PARAMS = frozenset(
+    Xarf.__init__.__code__.co_varnames[1:Xarf.__init__.__code__.co_argcount]
+)
@@ -0,0 +1,36 @@
+#! /usr/bin/env python
+'''
+:copyright: (c) 2014 by abusix GmbH
+:license: Apache2, see LICENSE.txt for more details.
+
+compiles x-arf schemas into a bundle, which is loaded at import time
+if the environment variable PYXARF_SCHEMA_BUNDLE points to it
+'''
+from __future__ import print_function
+
+from sys import exit
+from argparse import ArgumentParser
+from pyxarf import compile_bundle
+from pyxarf.exceptions import GeneralError
+
+if __name__ == '__main__':
+    parser = ArgumentParser(
+        description='xarfbundle - compile x-arf schemas into a bundle',
+    )
+    parser.add_argument('schema_urls', nargs='+', metavar='<url>',
+        help='urls of json schemas to bundle'
+    )
+    parser.add_argument('--output', required=True, metavar='<path>',
+        help='path of bundle file'
+    )
+    parser.add_argument('--schema-cache', metavar='<path>',
+        help='path for caching schemas'
+    )
+    args = parser.parse_args()
+
+    try:
+        compile_bundle(args.schema_urls, args.output, args.schema_cache)
+    except GeneralError as e:
+        exit('error: %s' % e)
+
+    print('bundled %d schema(s) to %s' % (len(args.schema_urls), args.output))
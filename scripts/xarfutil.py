@@ -6,13 +6,41 @@
 from __future__ import print_function
 
 import logging
+import smtplib
+import socket
+import sys
 
+from itertools import chain
 from sys import exit, argv
 from argparse import ArgumentParser, FileType, SUPPRESS
 from pyxarf import Xarf
-from pyxarf.exceptions import MissingParameterError, ValidationError
-from xarfmail import SMTP, XarfMail, lookup_contact
-import yaml
+from pyxarf.exceptions import GeneralError, MissingParameterError, \
+    ValidationError
+from xarfmail import SMTP, XarfMail, XarfMailTemplate, ContactResolver, \
+    lookup_contact
+from xarfmail.xarfmail import _is_connection_error
+
+
+class _Prepended(object):
+    '''
+    file like object returning head before the rest of fileobj, for
+    reading a stream whose first line was already consumed
+
+    '''
+    def __init__(self, head, fileobj):
+        self._head = head
+        self._fileobj = fileobj
+        self.name = getattr(fileobj, 'name', '<file>')
+
+    def read(self, size=-1):
+        if not self._head:
+            return self._fileobj.read(size)
+        data = self._head
+        self._head = ''
+        if size is None or size < 0:
+            return data + self._fileobj.read()
+        return data
+
 
 class Xarfutil(object):
     '''
@@ -28,23 +56,40 @@ class Xarfutil(object):
         '''
         self.xarf_args = {}
         self._groups = {}
+        self._resolver = None
 
         self._parser = ArgumentParser(
             description='xarfutil - xarf command line utility',
+            usage='%(prog)s [serve] [options]',
             argument_default=SUPPRESS,
         )
         self._add_arguments(self._parser)
 
-        (self.args, self._extra_args) = self._parser.parse_known_args()
+        # serve is a command, not an additional report argument
+        arguments = argv[1:]
+        self.serve = arguments[:1] == ['serve']
+        if self.serve:
+            arguments = arguments[1:]
+
+        (self.args, self._extra_args) = self._parser.parse_known_args(
+            arguments
+        )
         self.args = vars(self.args)
 
         if 'args' in self.args: # move args= to extra_args
             self._extra_args.insert(1, self.args.pop('args')[0])
 
-        # make sure parameter mode is not used together with file mode
-        self._handle_arg_conflicts(
-            ignore_groups=('mail options','output options')
-        )
+        # make sure parameter mode is not used together with file mode,
+        # in stream and serve mode parameters are defaults for all reports
+        ignore_groups = ('mail options','output options')
+        if 'stream' in self.args or self.serve:
+            ignore_groups += ('parameter mode',)
+        self._handle_arg_conflicts(ignore_groups=ignore_groups)
+
+        if self._get_settings('serve mode') and not self.serve:
+            exit('error: serve mode options require the serve command')
+        if self.serve and not self._get_settings('serve mode'):
+            exit('error: serve requires --socket or --http')
 
         self._check_file_parameters()
 
@@ -146,7 +191,7 @@ class Xarfutil(object):
             'read report data from input files (conflicts with parameter mode)'
         )
         self._add_group_argument(group_2, '--file-evidence',
-            type=FileType('r'), metavar='<path>',
+            type=FileType('rb'), metavar='<path>',
             help='file with evidence data (xarf part 3)'
         )
         self._add_group_argument(group_2, '--file-machine-readable',
@@ -159,50 +204,83 @@ class Xarfutil(object):
         )
 
         group_3 = parser.add_argument_group(
+            'stream mode',
+            'read many reports as newline delimited json or multi document '
+            'yaml, parameters are used as defaults (conflicts with file mode)'
+        )
+        self._add_group_argument(group_3, '--stream',
+            nargs='?', const='-', metavar='<path>',
+            help='file with one report per line or document (default: stdin)'
+        )
+        self._add_group_argument(group_3, '--stream-format',
+            choices=('auto', 'json', 'yaml'),
+            help='format of the stream (default: auto)'
+        )
+
+        group_4 = parser.add_argument_group(
+            'serve mode',
+            'keep running and answer report requests, parameters are used '
+            'as defaults (xarfutil.py serve, conflicts with file mode)'
+        )
+        self._add_group_argument(group_4, '--socket',
+            type=str, metavar='<path>',
+            help='unix socket for json requests, one per line'
+        )
+        self._add_group_argument(group_4, '--http',
+            type=str, metavar='<[host:]port>',
+            help='address for http requests (default host: 127.0.0.1)'
+        )
+        self._add_group_argument(group_4, '--queue-size',
+            type=int, metavar='<number>',
+            help='maximum number of mails waiting for delivery (default: '
+                 '10000)'
+        )
+
+        group_5 = parser.add_argument_group(
             'output options',
             'various settings for printing validated data to stdout'
         )
-        self._add_group_argument(group_3, '--output-json',
+        self._add_group_argument(group_5, '--output-json',
             action='store_true',
             help='print validated xarf report in json format'
         )
-        self._add_group_argument(group_3, '--output-yaml',
+        self._add_group_argument(group_5, '--output-yaml',
             action='store_true',
             help='print validated xarf report in yaml format'
         )
-        self._add_group_argument(group_3, '--output-email',
+        self._add_group_argument(group_5, '--output-email',
             action='store_true',
             help='print validated xarf report as raw email'
         )
 
-        group_4 = parser.add_argument_group(
+        group_6 = parser.add_argument_group(
             'mail options', 'options when directly sending reports by email'
         )
-        self._add_group_argument(group_4, '--mail-server-host',
+        self._add_group_argument(group_6, '--mail-server-host',
             type=str, metavar='<hostname>',
             help='mail server ip or hostname'
         )
-        self._add_group_argument(group_4, '--mail-server-port',
+        self._add_group_argument(group_6, '--mail-server-port',
             type=str, metavar='<port>',
             help='mail server port'
         )
-        self._add_group_argument(group_4, '--mail-server-user',
+        self._add_group_argument(group_6, '--mail-server-user',
             type=str, metavar='<username>',
             help='mail server username'
         )
-        self._add_group_argument(group_4, '--mail-server-pass',
+        self._add_group_argument(group_6, '--mail-server-pass',
             type=str, metavar='<password>',
             help='mail server password'
         )
-        self._add_group_argument(group_4, '--mail-from',
+        self._add_group_argument(group_6, '--mail-from',
             type=str, metavar='<from>',
             help='sender of report'
         )
-        self._add_group_argument(group_4, '--mail-subject',
+        self._add_group_argument(group_6, '--mail-subject',
             type=str, metavar='<subject>',
             help='subject of report'
         )
-        self._add_group_argument(group_4, '--mail-to',
+        self._add_group_argument(group_6, '--mail-to',
             type=str, metavar='<recipient>',
             help='recipient of report'
         )
@@ -216,6 +294,9 @@ class Xarfutil(object):
         file_handles = self._get_settings('file mode')
 
         if any(f in self.args for f in file_handles):
+            # yaml is only needed in file mode
+            import yaml
+
             if 'file_machine_readable' not in self.args:
                 exit(
                     'error: --file-machine-readable is required with file mode'
@@ -226,8 +307,8 @@ class Xarfutil(object):
                     'file_greeting'].read()
 
             if 'file_evidence' in self.args:
-                self.xarf_args['evidence'] = file_handles[
-                    'file_evidence'].read()
+                # read in chunks when the report gets rendered
+                self.xarf_args['evidence'] = file_handles['file_evidence']
 
             try:
                 self.xarf_args['machine_readable'] = yaml.load(
@@ -345,23 +426,60 @@ class Xarfutil(object):
                     settings[setting] = self.args[setting]
         return settings
 
-    def get_mail_to(self):
+    def get_mail_to(self, report):
+        '''
+        returns the recipient of the report mail, exits if there is none
+
+        :param report: xarf report object
+        :type report: :py:class:`Xarf`: object
+
+        :returns: recipient(s) of the report mail
+        :rtype: str or list
+
+        '''
+        mail_to = self._find_mail_to(report)
+        if not mail_to:
+            exit("You have to supply a to mail address either by using --mail-to or --lookup-contact")
+        return mail_to
+
+    def _find_mail_to(self, report):
+        '''
+        returns the recipient given with --mail-to or, with
+        --lookup-contact, the abuse contact of the report source
+
+        :param report: xarf report object
+        :type report: :py:class:`Xarf`: object
+
+        :returns: recipient(s) of the report mail or None
+        :rtype: str or list
+
+        '''
         mail_settings = self.get_mail_settings()
         mail_to = None
         if 'mail_to' in mail_settings:
             mail_to = mail_settings['mail_to']
-        if 'lookup_contact' in util.args and \
+        if 'lookup_contact' in self.args and \
                 report.machine_readable['Source-Type'][:2] == 'ip':
             try:
-                mail_to = lookup_contact(report.machine_readable['Source'])
+                mail_to = self._lookup_contact(
+                    report.machine_readable['Source']
+                )
             except ImportError:
                 raise
             except:
                 pass
-        if not mail_to:
-            exit("You have to supply a to mail address either by using --mail-to or --lookup-contact")
         return mail_to
 
+    def _lookup_contact(self, ip):
+        '''
+        looks up the abuse contact of ip, through a cache in stream and
+        serve mode
+
+        '''
+        if self._resolver is None:
+            return lookup_contact(ip)
+        return self._resolver.lookup(ip)
+
     def to_mail(self, report, mail_to=None):
         '''
         returns the raw email of the specified xarf report_obj
@@ -372,22 +490,35 @@ class Xarfutil(object):
         :returns: raw mail representation of xarf report
         :rtype: str
 
+        '''
+        return str(self.get_mail(report, mail_to))
+
+    def get_mail(self, report, mail_to=None):
+        '''
+        returns the email of the specified xarf report_obj
+
+        :param report: xarf report object
+        :type report: :py:class:`Xarf`: object
+
+        :returns: mail representation of xarf report
+        :rtype: :py:class:`XarfMail`
+
         '''
         greeting = ''
 
         if not mail_to:
-            mail_to = self.get_mail_to()
+            mail_to = self.get_mail_to(report)
 
         mail_settings = self.get_mail_settings()
         mail_from = mail_settings['mail_from']
         subject = mail_settings['mail_subject']
 
-        if 'greeting' in util.args:
-            greeting = util.args['greeting']
+        if 'greeting' in self.args:
+            greeting = self.args['greeting']
 
 
         self.mail_obj = XarfMail(report, mail_from, mail_to, subject, greeting)
-        return str(self.mail_obj)
+        return self.mail_obj
 
     def get_report(self, report):
         '''
@@ -422,6 +553,193 @@ class Xarfutil(object):
         except ValidationError as e:
             exit('error: validation failed! reason(s):\n%s' % e)
 
+    def iter_stream(self):
+        '''
+        reads the reports of the --stream input one by one, the
+        parameters given on the command line are defaults for every
+        report
+
+        :returns: generator of report parameters
+        :rtype: generator
+
+        '''
+        defaults = dict(self.xarf_args)
+        # passed to Xarf.iter_many separately
+        defaults.pop('schema_cache', None)
+
+        if self.args['stream'] == '-':
+            fileobj = sys.stdin
+        else:
+            fileobj = open(self.args['stream'])
+
+        try:
+            for document in self._iter_documents(fileobj):
+                row = dict(defaults)
+                row.update(document)
+                yield row
+        finally:
+            if fileobj is not sys.stdin:
+                fileobj.close()
+
+    def _iter_documents(self, fileobj):
+        '''
+        yields the json lines or yaml documents of fileobj, the format
+        is detected from the first line unless given with --stream-format
+
+        :param fileobj: input stream
+        :type fileobj: file
+
+        :returns: generator of dicts
+        :rtype: generator
+
+        '''
+        stream_format = self.args.get('stream_format', 'auto')
+        head = ''
+        if stream_format == 'auto':
+            for head in iter(fileobj.readline, ''):
+                if head.strip():
+                    break
+            stream_format = 'json' if head.lstrip()[:1] == '{' else 'yaml'
+
+        if stream_format == 'json':
+            import json
+            errors = ValueError
+            documents = (
+                json.loads(line) for line in chain((head,), fileobj)
+                if line.strip()
+            )
+        else:
+            import yaml
+            errors = yaml.YAMLError
+            documents = (
+                document for document
+                in yaml.safe_load_all(_Prepended(head, fileobj))
+                if document is not None
+            )
+
+        try:
+            for document in documents:
+                if not isinstance(document, dict):
+                    exit('error: --stream contains a %s instead of a report'
+                         % type(document).__name__)
+                yield document
+        except errors as e:
+            exit('error: --stream does not contain valid %s:\n%s'
+                 % (stream_format, e))
+
+    def run_stream(self):
+        '''
+        builds, validates and prints or sends the reports of the --stream
+        input one at a time. invalid reports are reported on stderr and
+        skipped.
+
+        :returns: error message if reports failed, None otherwise
+        :rtype: str
+
+        '''
+        send = 'send_email' in self.args
+        (failed, count) = (0, 0)
+        self._resolver = ContactResolver()
+
+        results = Xarf.iter_many(
+            self.iter_stream(),
+            schema_url=self.xarf_args.get('schema_url'),
+            schema_cache=self.xarf_args.get('schema_cache'),
+        )
+
+        smtp = None
+        if send:
+            mail_settings = self.get_mail_settings()
+            template = XarfMailTemplate(
+                mail_settings['mail_from'],
+                mail_settings['mail_subject'],
+                self.args.get('greeting', ''),
+            )
+            smtp = SMTP(
+                mail_settings['mail_server_host'],
+                mail_settings['mail_server_port'],
+                mail_settings.get('mail_server_user'),
+                mail_settings.get('mail_server_pass'),
+            )
+            try:
+                smtp.connect()
+            except Exception as e:
+                return 'error: could not connect to mail server: %s' % e
+
+        try:
+            for result in results:
+                count += 1
+                if result.error:
+                    failed += 1
+                    print('error: report %d: %s' % (count, result.error),
+                          file=sys.stderr)
+                    continue
+
+                if not send:
+                    output = self.get_report(result.report)
+                    if 'output_yaml' in self.args:
+                        output = '---\n' + output
+                    print(output)
+                    continue
+
+                mail_to = self._find_mail_to(result.report)
+                try:
+                    if not mail_to:
+                        raise ValueError('no mail address found')
+                    smtp.send(
+                        mail_settings['mail_from'], mail_to,
+                        template.render(result.report, mail_to),
+                    )
+                except Exception as e:
+                    failed += 1
+                    print('error: report %d: not sent: %s' % (count, e),
+                          file=sys.stderr)
+        finally:
+            if smtp is not None:
+                smtp.close()
+
+        if send:
+            print('%d of %d reports sent.' % (count - failed, count))
+        if failed:
+            return 'error: %d of %d reports failed' % (failed, count)
+
+    def run_server(self):
+        '''
+        answers report requests on --socket and --http until
+        interrupted, see :py:class:`XarfServer`
+
+        '''
+        import signal
+        import threading
+
+        xarf_server = XarfServer(self)
+        servers = []
+        if 'socket' in self.args:
+            servers.append(
+                _get_socket_server(xarf_server, self.args['socket'])
+            )
+        if 'http' in self.args:
+            servers.append(_get_http_server(xarf_server, self.args['http']))
+
+        # send the queued mails before stopping
+        signal.signal(signal.SIGTERM, lambda signum, frame: exit(0))
+
+        for server in servers[1:]:
+            thread = threading.Thread(target=server.serve_forever)
+            thread.daemon = True
+            thread.start()
+        try:
+            servers[0].serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for server in servers:
+                server.server_close()
+            if 'socket' in self.args:
+                import os
+                os.unlink(self.args['socket'])
+            xarf_server.close()
+
     def print_help(self):
         '''
         shows the dynamically built help of :py:class:`ArgumentParser`:
@@ -450,6 +768,371 @@ class Xarfutil(object):
         '''
         return self._get_settings('file mode')
 
+class XarfServer(object):
+    '''
+    answers report requests of the serve command. schemas, validators,
+    the mail template, the contact cache and the connection to the mail
+    server are kept for all requests; mails are sent by a background
+    thread.
+
+    a request is a dict with the report parameters in report, the
+    output format json, yaml or mail in output, and send set to queue
+    the report mail for delivery, optionally to mail_to.
+
+    while the mail server can not be reached, the delivery thread keeps
+    the mails queued and reconnects with growing delays of up to
+    max_backoff seconds.
+
+    :param util: command line settings
+    :type util: :py:class:`Xarfutil`
+
+    '''
+    max_backoff = 60
+
+    def __init__(self, util):
+        import threading
+        try:
+            from queue import Queue
+        except ImportError:
+            from Queue import Queue
+
+        self._util = util
+        self._defaults = dict(util.xarf_args)
+        self._schema_cache = self._defaults.pop('schema_cache', None)
+        self._template = None
+        self._queue = Queue(util.args.get('queue_size', 10000))
+        self._sender = None
+        self._sender_lock = threading.Lock()
+        self._closing = threading.Event()
+        self._delivery_error = None
+        self.sent = 0
+        self.failed = 0
+
+        util._resolver = ContactResolver()
+
+    def handle(self, request):
+        '''
+        builds and validates the report of a request
+
+        :param request: report request
+        :type request: dict
+
+        :returns: output, queued or error of the request
+        :rtype: dict
+
+        '''
+        if not isinstance(request, dict) or \
+                not isinstance(request.get('report', {}), dict):
+            return {'error': 'request is not a report request'}
+        mail_to = request.get('mail_to')
+        if mail_to is not None and not _is_mail_to(mail_to):
+            return {'error': 'mail_to is not a mail address or list of them'}
+
+        row = dict(self._defaults)
+        row.update(request.get('report', {}))
+        try:
+            result = next(Xarf.iter_many(
+                [row], schema_cache=self._schema_cache
+            ))
+        except GeneralError as e:
+            return {'error': str(e)}
+        if result.error:
+            return {'error': str(result.error)}
+        report = result.report
+
+        output = request.get('output', 'json')
+        send = request.get('send', False)
+        try:
+            if send or output == 'mail':
+                mail_to = mail_to or self._util._find_mail_to(report)
+                if not mail_to:
+                    return {'error': 'no mail address found'}
+                mail = self._get_template().render(report, mail_to)
+                if send:
+                    return self._enqueue(mail_to, mail)
+                return {'output': str(mail)}
+            if output == 'yaml':
+                return {'output': report.to_yaml()}
+            if output == 'json':
+                return {'output': report.to_json()}
+        except KeyError as e:
+            return {'error': 'missing mail option --%s'
+                             % e.args[0].replace('_', '-')}
+        return {'error': 'unknown output %s' % output}
+
+    def _get_template(self):
+        if self._template is None:
+            mail_settings = self._util.get_mail_settings()
+            self._template = XarfMailTemplate(
+                mail_settings['mail_from'],
+                mail_settings['mail_subject'],
+                self._util.args.get('greeting', ''),
+            )
+        return self._template
+
+    def _enqueue(self, mail_to, mail):
+        '''
+        queues a mail for delivery, starting the delivery thread on
+        first use or again if it stopped
+        '''
+        try:
+            from queue import Full
+        except ImportError:
+            from Queue import Full
+
+        if self._delivery_error is not None:
+            return {'error': 'delivery is stopped: %s' % self._delivery_error}
+        if self._closing.is_set():
+            return {'error': 'delivery is stopped'}
+
+        with self._sender_lock:
+            if self._sender is None or not self._sender.is_alive():
+                if self._sender is not None:
+                    logging.getLogger('xarfutil').error(
+                        'delivery thread died, restarting it'
+                    )
+                self._start_sender()
+
+        try:
+            self._queue.put_nowait((mail_to, mail))
+        except Full:
+            return {'error': 'delivery queue is full'}
+        return {'queued': True}
+
+    def _start_sender(self):
+        import threading
+
+        mail_settings = self._util.get_mail_settings()
+        smtp = SMTP(
+            mail_settings['mail_server_host'],
+            mail_settings['mail_server_port'],
+            mail_settings.get('mail_server_user'),
+            mail_settings.get('mail_server_pass'),
+        )
+        self._sender = threading.Thread(target=self._deliver, args=(
+            smtp, mail_settings['mail_from']
+        ))
+        self._sender.daemon = True
+        self._sender.start()
+
+    def _deliver(self, smtp, mail_from):
+        '''
+        sends queued mails over one persistent connection until the
+        queue returns None. a mail which could not be sent because the
+        mail server is unreachable is retried after reconnecting, unless
+        the server is closing. if the mail server refuses the connection
+        for good, e.g. the credentials are wrong, all mails are dropped
+        and no more mails are accepted.
+        '''
+        logger = logging.getLogger('xarfutil')
+        connected = False
+        dropping = False
+        backoff = 1
+        item = None
+        try:
+            while True:
+                if item is None:
+                    item = self._queue.get()
+                    if item is None:
+                        return
+                (mail_to, mail) = item
+
+                if dropping:
+                    self.failed += 1
+                    item = None
+                    continue
+
+                try:
+                    if not connected:
+                        smtp.connect()
+                        connected = True
+                    smtp.send(mail_from, mail_to, mail)
+                except Exception as e:
+                    if connected and not _is_connection_error(e):
+                        self.failed += 1
+                        logger.warning('report mail to %s not sent: %s',
+                                       mail_to, e)
+                        item = None
+                        continue
+
+                    # connecting failed or the connection was lost
+                    connected = False
+                    smtp.close()
+                    if not _is_unreachable(e):
+                        # retrying does not help
+                        logger.error('mail server refused the connection, '
+                                     'dropping the queued mails: %s', e)
+                        self._delivery_error = e
+                        dropping = True
+                        continue
+                    if self._closing.is_set():
+                        # the remaining mails are dropped without waiting
+                        # for more connection timeouts
+                        logger.error('mail server unreachable, dropping '
+                                     'the queued mails: %s', e)
+                        dropping = True
+                        continue
+                    logger.warning('mail server unreachable, retrying in '
+                                   '%d seconds: %s', backoff, e)
+                    self._closing.wait(backoff)
+                    backoff = min(backoff * 2, self.max_backoff)
+                else:
+                    self.sent += 1
+                    backoff = 1
+                    item = None
+        finally:
+            smtp.close()
+
+    def close(self):
+        '''
+        waits until all queued mails are sent. mails which can not be
+        sent because the mail server is unreachable are dropped.
+        '''
+        try:
+            from queue import Full
+        except ImportError:
+            from Queue import Full
+
+        self._closing.set()
+        if self._sender is None:
+            return
+
+        # a full queue drains as long as the delivery thread runs
+        while self._sender.is_alive():
+            try:
+                self._queue.put(None, timeout=1)
+                break
+            except Full:
+                pass
+        self._sender.join()
+
+
+def _is_unreachable(error):
+    '''
+    checks if connecting to the mail server failed for now, unlike
+    permanent failures such as refused credentials
+    '''
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    return _is_connection_error(error) or \
+        isinstance(error, (socket.timeout, socket.gaierror))
+
+
+def _is_mail_to(mail_to):
+    '''
+    checks that a requested mail_to is a mail address or a list of
+    them. line breaks are refused, they would add headers to the mail.
+    '''
+    if not isinstance(mail_to, list):
+        mail_to = [mail_to]
+    return bool(mail_to) and all(
+        isinstance(address, (str, type(u''))) and address and
+        '\r' not in address and '\n' not in address
+        for address in mail_to
+    )
+
+
+def _get_socket_server(xarf_server, path):
+    '''
+    returns a threading unix socket server reading one json request per
+    line and writing one json response per line, requests of a
+    connection are answered in order
+    '''
+    import json
+    import os
+    import stat
+    try:
+        import socketserver
+    except ImportError:
+        import SocketServer as socketserver
+
+    class RequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in iter(self.rfile.readline, b''):
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line.decode('utf-8'))
+                except ValueError as e:
+                    response = {'error': 'invalid json: %s' % e}
+                else:
+                    response = xarf_server.handle(request)
+                self.wfile.write(json.dumps(response).encode('utf-8'))
+                self.wfile.write(b'\n')
+                self.wfile.flush()
+
+    # replace the socket of a previous run
+    if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+        os.unlink(path)
+
+    server = socketserver.ThreadingUnixStreamServer(path, RequestHandler)
+    server.daemon_threads = True
+    return server
+
+
+def _get_http_server(xarf_server, address):
+    '''
+    returns a threading http server answering POST requests with a json
+    request body. outputs are returned as response body, errors and
+    queued mails as json.
+    '''
+    import json
+    try:
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+        from socketserver import ThreadingMixIn
+    except ImportError:
+        from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+        from SocketServer import ThreadingMixIn
+
+    content_types = {
+        'json': 'application/json',
+        'yaml': 'application/x-yaml',
+        'mail': 'message/rfc822',
+    }
+
+    class RequestHandler(BaseHTTPRequestHandler):
+        # keep connections open for following requests, and write
+        # headers and body in one packet instead of waiting for the ack
+        protocol_version = 'HTTP/1.1'
+        wbufsize = -1
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            try:
+                request = json.loads(self.rfile.read(length).decode('utf-8'))
+            except ValueError as e:
+                response = {'error': 'invalid json: %s' % e}
+            else:
+                response = xarf_server.handle(request)
+
+            if 'output' in response:
+                self._respond(200, content_types.get(
+                    request.get('output', 'json'), 'text/plain'
+                ) + '; charset=utf-8', response['output'])
+            elif 'queued' in response:
+                self._respond(202, 'application/json', json.dumps(response))
+            else:
+                self._respond(400, 'application/json', json.dumps(response))
+
+        def _respond(self, status, content_type, body):
+            body = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.getLogger('xarfutil').debug(format, *args)
+
+    class Server(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+    (host, _, port) = address.rpartition(':')
+    return Server((host or '127.0.0.1', int(port)), RequestHandler)
+
+
 if __name__ == '__main__':
     '''
     main function with primary application logic and error handling.
@@ -462,6 +1145,20 @@ if __name__ == '__main__':
     if len(argv) == 1:
         exit(util.print_help())
 
+    logging.basicConfig(
+        format='%(asctime)s %(name)s %(levelname)s - %(message)s',
+        level=logging.DEBUG if 'debug' in util.args else logging.WARNING,
+    )
+
+    if util.serve:
+        exit(util.run_server())
+
+    if 'stream' in util.args:
+        try:
+            exit(util.run_stream())
+        except GeneralError as e:
+            exit('error: %s' % e)
+
     try:
         report = util.xarf(**util.xarf_args)
     except MissingParameterError as e:
@@ -472,8 +1169,8 @@ if __name__ == '__main__':
         exit('error: validation failed! reason(s):\n%s' % e)
 
     if 'send_email' in util.args:
-        mail_to = util.get_mail_to()
-        raw_email = util.to_mail(report, mail_to)
+        mail_to = util.get_mail_to(report)
+        mail = util.get_mail(report, mail_to)
 
         mail_settings = util.get_mail_settings()
         mail_from = mail_settings['mail_from']
@@ -493,7 +1190,7 @@ if __name__ == '__main__':
         )
 
         try:
-            smtp_server.send(mail_from, mail_to, raw_email)
+            smtp_server.send(mail_from, mail_to, mail)
         except:
             exit('Something went wrong while sending the Report.')
         else:
@@ -53,5 +53,5 @@ setup(
     keywords = ['keyword', 'search', 'purepython', 'aho-corasick', 'ahocorasick', 'abusix'],
     license='Apache Software License',
     version=__version__,
-    scripts=['scripts/xarfutil.py'],
+    scripts=['scripts/xarfutil.py', 'scripts/xarfbundle.py'],
 )
@@ -0,0 +1,349 @@
+#!/usr/bin/env python
+'''
+rough numbers for xarfmail without network access, run from the
+repository root:
+
+    python tests/benchmail.py
+
+'''
+from __future__ import print_function
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import tracemalloc
+
+from email.errors import HeaderParseError
+from email.generator import Generator
+from io import BytesIO
+from os.path import abspath, dirname
+
+ROOT = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pyxarf import Xarf
+from xarfmail import ContactResolver, XarfMail, XarfMailTemplate, \
+    lookup_contacts
+
+SCHEMA_URL = 'http://xarf.org/schema/abuse_login-attack_0.1.2.json'
+SCHEMA_CACHE = '/tmp/'
+
+# distinct ips, each looked up by the fake finder
+IP_COUNT = 2000
+# simulated latency of a dns lookup in seconds
+LOOKUP_LATENCY = 0.01
+LOOKUP_WORKERS = 64
+# size of the evidence file streamed into a mail
+EVIDENCE_SIZE = 100 * 1024 * 1024
+# upper bound of bytes allocated while writing a mail with that evidence
+EVIDENCE_BUDGET = 4 * 1024 * 1024
+# mails rendered per run of the mail benchmarks
+MAIL_COUNT = 2000
+GREETING = u'''Hello,
+
+we have detected abuse from an ip address within your network, please
+find the details attached.
+'''
+
+
+class FakeContactFinder(object):
+    '''
+    stands in for querycontacts.ContactFinder, answers after latency
+    seconds (or hang[ip] seconds) and never for addresses in 10.9.0.0/16
+    '''
+    def __init__(self, latency=LOOKUP_LATENCY, hang=None):
+        self.latency = latency
+        self.hang = hang or {}
+        self.lookups = 0
+        self._lock = threading.Lock()
+
+    def find(self, ip):
+        with self._lock:
+            self.lookups += 1
+        time.sleep(self.hang.get(ip, self.latency))
+        if ip.startswith('10.9.'):
+            return None
+        return ['abuse@net%s.example' % ip.split('.')[1]]
+
+
+ips = ['10.%d.%d.%d' % (i % 10, i // 256 % 256, i % 256)
+       for i in range(IP_COUNT)]
+
+
+def bulk_lookup():
+    finder = FakeContactFinder()
+    # every ip twice, duplicates must not be looked up again
+    started = time.time()
+    contacts = lookup_contacts(
+        ips + ips, max_workers=LOOKUP_WORKERS, resolve=finder.find
+    )
+    seconds = time.time() - started
+
+    assert len(contacts) == IP_COUNT, len(contacts)
+    assert finder.lookups == IP_COUNT, finder.lookups
+    assert contacts['10.9.0.9'] is None
+    assert contacts['10.1.0.1'] == ['abuse@net1.example']
+    return seconds
+
+
+def bulk_lookup_timeout():
+    finder = FakeContactFinder(hang={'10.1.0.1': 5.0, '10.2.0.2': 5.0})
+    started = time.time()
+    contacts = lookup_contacts(
+        ips[:200], max_workers=2, timeout=0.2, resolve=finder.find
+    )
+    seconds = time.time() - started
+
+    assert contacts['10.1.0.1'] is None
+    assert contacts['10.3.0.3'] == ['abuse@net3.example']
+    # the hanging lookups must not hold back the remaining ones
+    assert seconds < 2.0, seconds
+    return seconds
+
+
+def cached_lookup():
+    finder = FakeContactFinder(latency=0)
+    resolver = ContactResolver(finder, ipv4_prefix=16)
+    for ip in ips:
+        resolver.lookup(ip)
+
+    stats = resolver.stats()
+    assert finder.lookups == stats['misses'] == 10, stats
+    return stats
+
+
+def negative_expiry(negative_ttl=0.1):
+    finder = FakeContactFinder(latency=0)
+    resolver = ContactResolver(finder, negative_ttl=negative_ttl)
+    assert resolver.lookup('10.9.0.1') is None
+    assert resolver.lookup('10.9.0.1') is None
+    assert finder.lookups == 1
+    assert resolver.stats()['negative_hits'] == 1
+
+    time.sleep(negative_ttl * 1.5)
+    assert resolver.lookup('10.9.0.1') is None
+    assert finder.lookups == 2
+    return 'expired'
+
+
+def persistent_cache():
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'contacts.json')
+    try:
+        finder = FakeContactFinder(latency=0)
+        resolver = ContactResolver(finder, cache_path=path)
+        for ip in ('10.1.0.1', '10.2.0.2', '10.9.0.9'):
+            resolver.lookup(ip)
+        resolver.save()
+
+        # a new resolver answers from the file, negative answers too
+        finder = FakeContactFinder(latency=0)
+        resolver = ContactResolver(finder, cache_path=path)
+        assert len(resolver) == 3
+        assert resolver.lookup('10.1.0.1') == ['abuse@net1.example']
+        assert resolver.lookup('10.9.0.9') is None
+        assert finder.lookups == 0
+
+        # malformed files and entries are skipped
+        expires = time.time() + 60
+        for content in (
+            '{"10.1.0.1": [1e18, ["abuse@net1', '[1, 2]', '"text"', '{}',
+        ):
+            with open(path, 'w') as f:
+                f.write(content)
+            assert len(ContactResolver(finder, cache_path=path)) == 0
+        with open(path, 'w') as f:
+            json.dump({
+                'short': [expires],
+                'string': 'abuse@example.com',
+                'expires': ['soon', None],
+                'contacts': [expires, 'abuse@example.com'],
+                'numbers': [expires, [1, 2]],
+                'valid': [expires, ['abuse@example.com']],
+                'negative': [expires, None],
+                'expired': [expires - 120, None],
+            }, f)
+        resolver = ContactResolver(finder, cache_path=path)
+        assert sorted(resolver._entries) == ['negative', 'valid'], \
+            resolver._entries
+    finally:
+        shutil.rmtree(directory)
+    return 'reloaded'
+
+
+class CountingFile(object):
+    '''
+    binary file object which only counts the bytes written to it
+    '''
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+
+
+def make_report(source='10.0.0.1', evidence=None):
+    return Xarf(
+        schema_url=SCHEMA_URL,
+        schema_cache=SCHEMA_CACHE,
+        reported_from='reporter@example.com',
+        category='abuse',
+        report_type='login-attack',
+        report_id='1',
+        date='Jan  1 2014 02:13:35 +0100',
+        source=source,
+        source_type='ip-address',
+        attachment='text/plain',
+        port=22,
+        service='ssh',
+        evidence=evidence,
+    )
+
+
+def evidence_memory():
+    report = make_report()
+
+    with tempfile.NamedTemporaryFile() as f:
+        chunk = os.urandom(1024 * 1024)
+        for _ in range(EVIDENCE_SIZE // len(chunk)):
+            f.write(chunk)
+        f.flush()
+
+        report.add_evidence(path=f.name)
+        mail = XarfMail(
+            report, 'reporter@example.com', 'abuse@example.com',
+            'abuse report', 'hello',
+        )
+
+        out = CountingFile()
+        tracemalloc.start()
+        mail.write_to(out)
+        (current, peak) = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    # base64 adds a third plus line breaks
+    assert out.size > EVIDENCE_SIZE * 4 // 3, out.size
+    assert peak < EVIDENCE_BUDGET, peak
+    return peak
+
+
+def mail_rate():
+    reports = [
+        make_report('10.0.%d.%d' % (i // 256, i % 256), 'evidence %d' % i)
+        for i in range(MAIL_COUNT)
+    ]
+    template = XarfMailTemplate(
+        'reporter@example.com', 'abuse report', GREETING
+    )
+
+    def build_mails():
+        for report in reports:
+            XarfMail(
+                report, 'reporter@example.com', 'abuse@example.com',
+                'abuse report', GREETING,
+            ).write_to(CountingFile())
+
+    def render_mails():
+        for report in reports:
+            template.render(report, 'abuse@example.com').write_to(
+                CountingFile()
+            )
+
+    return (
+        MAIL_COUNT / min(timeit.repeat(build_mails, number=1, repeat=3)),
+        MAIL_COUNT / min(timeit.repeat(render_mails, number=1, repeat=3)),
+    )
+
+
+def write_bytes(mail):
+    out = BytesIO()
+    mail.write_to(out)
+    return out.getvalue()
+
+
+def same_bytes():
+    '''
+    checks that rendered mails equal the mails built by XarfMail, with
+    a fixed MIME boundary
+    '''
+    make_boundary = Generator.__dict__['_make_boundary']
+    Generator._make_boundary = classmethod(
+        lambda cls, text=None: '===============0123456789=='
+    )
+    (fd, path) = tempfile.mkstemp()
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b'binary\x00evidence\n' * 1000)
+        by_reference = make_report()
+        by_reference.add_evidence(path=path)
+
+        template = XarfMailTemplate(
+            'reporter@example.com', 'abuse report', GREETING
+        )
+        reports = [
+            make_report(), make_report(evidence='evidence\nline 2\n'),
+            make_report(evidence=u'\xe9vidence'), by_reference,
+        ]
+        recipients = [
+            'abuse@example.com', ['a@example.com', 'b@example.com'],
+            u'abuse@b\xfccher.example',
+        ]
+        for report in reports:
+            for mail_to in recipients:
+                built = write_bytes(XarfMail(
+                    report, 'reporter@example.com', mail_to,
+                    'abuse report', GREETING,
+                ))
+                rendered = write_bytes(template.render(report, mail_to))
+                assert rendered == built, (report.evidence, mail_to)
+    finally:
+        Generator._make_boundary = make_boundary
+        os.unlink(path)
+    return 'identical'
+
+
+def header_injection():
+    template = XarfMailTemplate(
+        'reporter@example.com', 'abuse report', GREETING
+    )
+    for mail_to in (
+        'abuse@example.com\r\nBcc: other@example.com',
+        ['abuse@example.com', 'x@example.com\nBcc: other@example.com'],
+    ):
+        try:
+            template.render(make_report(), mail_to)
+        except HeaderParseError:
+            pass
+        else:
+            raise AssertionError('header injected: %r' % mail_to)
+    return 'rejected'
+
+
+if __name__ == '__main__':
+    seconds = bulk_lookup()
+    print('%-32s %10.0f lookups/s' % ('lookup_contacts', IP_COUNT / seconds))
+    print('%-32s %10.0f lookups/s' % (
+        'sequential (estimated)', 1 / LOOKUP_LATENCY
+    ))
+    print('%-32s %10.2f s' % ('lookup_contacts with timeouts',
+                              bulk_lookup_timeout()))
+    print('%-32s %10s' % ('ContactResolver /16', cached_lookup()))
+    print('%-32s %10s' % ('ContactResolver negative_ttl',
+                          negative_expiry()))
+    print('%-32s %10s' % ('ContactResolver save/load', persistent_cache()))
+    print('%-32s %10.0f bytes' % (
+        'peak memory, %d MB evidence' % (EVIDENCE_SIZE // 1024 // 1024),
+        evidence_memory()
+    ))
+
+    (built, rendered) = mail_rate()
+    print('%-32s %10.0f mails/s' % ('XarfMail', built))
+    print('%-32s %10.0f mails/s' % ('XarfMailTemplate', rendered))
+    assert rendered > built, (rendered, built)
+    print('%-32s %10s' % ('template and XarfMail bytes', same_bytes()))
+    print('%-32s %10s' % ('line breaks in recipient', header_injection()))
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+'''
+rough throughput numbers for the different ways of building reports,
+run from the repository root:
+
+    python tests/benchxarf.py
+
+'''
+from __future__ import print_function
+
+import io
+import multiprocessing
+import subprocess
+import sys
+import timeit
+import tracemalloc
+
+from os.path import abspath, dirname
+
+ROOT = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pyxarf import Xarf, dump_many, set_json_backend, validate_many
+from pyxarf.jsonio import JSON_BACKENDS
+
+SCHEMA_URL = 'http://xarf.org/schema/abuse_login-attack_0.1.2.json'
+SCHEMA_CACHE = '/tmp/'
+COUNT = 5000
+# upper bound of bytes per XarfReport on top of the row values
+RECORD_BUDGET = 320
+# upper bound of microseconds for constructing one Xarf object
+CONSTRUCT_BUDGET = 25
+# upper bound of microseconds for importing pyxarf
+IMPORT_BUDGET = 30000
+# dependencies which must not be loaded by importing pyxarf
+LAZY_MODULES = ('requests', 'yaml', 'jsonschema')
+
+rows = [{
+    'Reported-From': 'reporter@example.com',
+    'Category': 'abuse',
+    'Report-Type': 'login-attack',
+    'Service': 'ssh',
+    'Date': 'Jan  1 2014 02:13:35 +0100',
+    'Source-Type': 'ip-address',
+    'Source': '10.0.%d.%d' % (i // 256 % 256, i % 256),
+    'Port': 22,
+    'Report-ID': str(i),
+    'Attachment': 'text/plain',
+    'Schema-URL': SCHEMA_URL,
+    'evidence': 'evidence data belongs here',
+} for i in range(COUNT)]
+
+
+def report(name, seconds, count=COUNT):
+    print('%-32s %10.0f reports/s' % (name, count / seconds))
+
+
+def construct():
+    data = dict(rows[0])
+    evidence = data.pop('evidence')
+    count = 20000
+    seconds = min(timeit.repeat(
+        lambda: Xarf.from_machine_readable(data, evidence),
+        number=count, repeat=3,
+    ))
+    return seconds / count * 1e6
+
+
+def per_object():
+    for row in rows:
+        data = dict(row)
+        evidence = data.pop('evidence')
+        Xarf.from_machine_readable(data, evidence).to_json()
+
+
+def build_many():
+    Xarf.build_many(rows, schema_url=SCHEMA_URL, output='json')
+
+
+def copy_with():
+    data = dict(rows[0])
+    evidence = data.pop('evidence')
+    report = Xarf.from_machine_readable(data, evidence)
+    report.get_report_obj()
+
+    for row in rows:
+        report.copy_with(
+            date=row['Date'], evidence=row['evidence']
+        ).get_report_obj()
+
+    # like the constructor, a report without evidence has no attachment
+    copy = report.copy_with(evidence=None)
+    assert copy.get_report_obj()['machine_readable']['Attachment'] == 'none'
+
+
+def json_backends():
+    reports = [result.report for result in Xarf.iter_many(rows)]
+    records = [report.to_record() for report in reports]
+
+    for backend in JSON_BACKENDS:
+        try:
+            set_json_backend(backend)
+        except ImportError:
+            print('%-32s %10s' % (backend, 'missing'))
+            continue
+
+        report('%s to_json' % backend, timeit.timeit(
+            lambda: [r.to_json() for r in reports], number=1
+        ))
+        report('%s to_json(as_bytes)' % backend, timeit.timeit(
+            lambda: [r.to_json(as_bytes=True) for r in reports], number=1
+        ))
+        report('%s dump_many' % backend, timeit.timeit(
+            lambda: dump_many(records, io.BytesIO()), number=1
+        ))
+
+    set_json_backend('json')
+
+
+def parallel_validation():
+    records = [result.report.to_record() for result in Xarf.iter_many(rows)]
+    records = records * 20
+
+    for processes in sorted(set((1, multiprocessing.cpu_count()))):
+        report('validate_many(processes=%d)' % processes, timeit.timeit(
+            lambda: validate_many(records, processes), number=1
+        ), len(records))
+
+
+def memory_per_report(build):
+    reports = [result.report for result in Xarf.iter_many(rows)]
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [build(report) for report in reports]
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    assert len(kept) == COUNT
+    return size / COUNT
+
+
+def import_time():
+    code = 'import sys, pyxarf; print(" ".join(sorted(sys.modules)))'
+    process = subprocess.Popen(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    (stdout, stderr) = process.communicate()
+
+    loaded = [name for name in LAZY_MODULES if name in stdout.split()]
+    assert not loaded, 'eagerly imported: %s' % ', '.join(loaded)
+
+    for line in stderr.splitlines():
+        (_, cumulative, name) = line.split('|')
+        if name.strip() == 'pyxarf':
+            return int(cumulative)
+
+
+if __name__ == '__main__':
+    micros = import_time()
+    print('%-32s %10d us' % ('import pyxarf', micros))
+    assert micros < IMPORT_BUDGET, micros
+
+    # warm up the schema registry
+    Xarf.build_many(rows[:1], schema_url=SCHEMA_URL, schema_cache=SCHEMA_CACHE)
+
+    micros = construct()
+    print('%-32s %10.1f us' % ('Xarf construction', micros))
+    assert micros < CONSTRUCT_BUDGET, micros
+
+    report('Xarf.from_machine_readable', timeit.timeit(per_object, number=1))
+    report('Xarf.build_many', timeit.timeit(build_many, number=1))
+    report('Xarf.copy_with', timeit.timeit(copy_with, number=1))
+    json_backends()
+    parallel_validation()
+
+    xarf_size = memory_per_report(lambda report: Xarf.from_record(
+        report.to_record()
+    ))
+    record_size = memory_per_report(lambda report: report.to_record())
+    print('%-32s %10.0f bytes/report' % ('Xarf', xarf_size))
+    print('%-32s %10.0f bytes/report' % ('XarfReport', record_size))
+    assert record_size < RECORD_BUDGET, record_size
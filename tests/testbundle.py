@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+'''
+checks schema bundles and loading them at import time, run from the
+repository root:
+
+    python tests/testbundle.py
+
+'''
+from __future__ import print_function
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from os.path import abspath, dirname, join
+
+ROOT = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pyxarf import SchemaRegistry, compile_bundle, load_bundle
+from pyxarf.bundle import BUNDLE_ENV
+from pyxarf.exceptions import GeneralError
+from pyxarf.registry import SchemaEntry, convert_schema
+
+# nothing listens here, any download fails
+URL = 'http://127.0.0.1:1/schema_%d.json'
+COUNT = 100
+
+
+def make_bundle(path):
+    registry = SchemaRegistry(maxsize=None)
+    for i in range(COUNT):
+        (schema, required_keys) = convert_schema({
+            'type': 'object',
+            'properties': {'Source': {'type': 'string'}},
+        })
+        registry.add(SchemaEntry(URL % i, schema, required_keys))
+    compile_bundle([URL % i for i in range(COUNT)], path, registry=registry)
+
+
+def failed_write(directory):
+    # renaming the bundle onto a directory fails after it was written
+    path = join(directory, 'taken.bundle')
+    os.mkdir(path)
+    try:
+        compile_bundle([], path, registry=SchemaRegistry())
+    except GeneralError:
+        pass
+    else:
+        raise AssertionError('wrote bundle onto a directory')
+    finally:
+        os.rmdir(path)
+
+    leftovers = [name for name in os.listdir(directory)
+                 if name.startswith('.taken.bundle.')]
+    assert not leftovers, leftovers
+    print('failed write: no temporary file left behind')
+
+
+def pinned_entries(path):
+    registry = SchemaRegistry(maxsize=4)
+    assert load_bundle(path, registry) == COUNT
+
+    # downloaded schemas evict each other, bundled ones stay
+    for i in range(10):
+        (schema, required_keys) = convert_schema({'type': 'object'})
+        registry.add(SchemaEntry('http://example.com/%d' % i, schema, {}))
+    for i in range(COUNT):
+        assert registry.get(URL % i).url == URL % i
+
+    stats = registry.stats()
+    assert stats['size'] == COUNT + 4, stats
+    assert stats['pinned'] == COUNT, stats
+    assert stats['evictions'] == 6, stats
+    print('registry(maxsize=4): %d bundled schemas kept' % COUNT)
+
+
+def broken_bundle(path):
+    try:
+        load_bundle(path, SchemaRegistry())
+    except GeneralError:
+        return
+    raise AssertionError('loaded broken bundle %s' % path)
+
+
+def import_with_bundle(path):
+    code = (
+        'import sys; sys.path.insert(0, %r)\n'
+        'import pyxarf\n'
+        'print(pyxarf.default_registry.stats()["pinned"])\n' % ROOT
+    )
+    env = dict(os.environ)
+    env[BUNDLE_ENV] = path
+    process = subprocess.Popen(
+        [sys.executable, '-c', code], env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    (stdout, stderr) = process.communicate()
+    assert process.returncode == 0, stderr
+    return (int(stdout), stderr)
+
+
+if __name__ == '__main__':
+    directory = tempfile.mkdtemp()
+    try:
+        bundle = join(directory, 'schemas.bundle')
+        make_bundle(bundle)
+        pinned_entries(bundle)
+
+        (pinned, stderr) = import_with_bundle(bundle)
+        assert pinned == COUNT and not stderr, stderr
+        print('import: %d schemas loaded from %s' % (pinned, BUNDLE_ENV))
+
+        corrupt = join(directory, 'corrupt.bundle')
+        with open(corrupt, 'wb') as f:
+            f.write(b'not a pickle')
+        for path in (join(directory, 'missing.bundle'), corrupt):
+            broken_bundle(path)
+            (pinned, stderr) = import_with_bundle(path)
+            assert pinned == 0 and 'not loaded' in stderr, stderr
+        print('import: missing and corrupt bundles only warn')
+
+        failed_write(directory)
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+'''
+checks that validate_many in worker processes reports the same errors
+as validating each report on its own, in input order, run from the
+repository root:
+
+    python tests/testparallel.py
+
+'''
+from __future__ import print_function
+
+import sys
+
+from os.path import abspath, dirname
+
+ROOT = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pyxarf import Xarf, validate_many
+from pyxarf.exceptions import ValidationError
+
+SCHEMA_URL = 'http://xarf.org/schema/abuse_login-attack_0.1.2.json'
+SCHEMA_CACHE = '/tmp/'
+COUNT = 500
+
+
+def make_reports():
+    '''
+    returns valid records mixed with xarf objects made invalid in ways
+    that differ from report to report
+    '''
+    rows = [{
+        'Reported-From': 'reporter@example.com',
+        'Category': 'abuse',
+        'Report-Type': 'login-attack',
+        'Service': 'ssh',
+        'Date': 'Jan  1 2014 02:13:35 +0100',
+        'Source-Type': 'ip-address',
+        'Source': '10.0.%d.%d' % (i // 256 % 256, i % 256),
+        'Port': 22,
+        'Report-ID': str(i),
+        'Attachment': 'text/plain',
+        'Schema-URL': SCHEMA_URL,
+        'evidence': 'evidence data belongs here',
+    } for i in range(COUNT)]
+
+    reports = []
+    for result in Xarf.iter_many(rows, schema_cache=SCHEMA_CACHE):
+        if result.index % 3 == 0:
+            reports.append(result.report.to_record())
+            continue
+
+        machine_readable = result.report.machine_readable
+        if result.index % 3 == 1:
+            machine_readable['Port'] = 70000 + result.index
+        else:
+            machine_readable['Source-Type'] = 'host-%d' % result.index
+            machine_readable['Report-ID'] = result.index
+        reports.append(result.report)
+    return reports
+
+
+def expected_errors(report):
+    if not isinstance(report, Xarf):
+        report = Xarf.from_record(report)
+    try:
+        report.get_report_obj('machine_readable')
+    except ValidationError as error:
+        return str(error)
+    return ''
+
+
+if __name__ == '__main__':
+    reports = make_reports()
+    expected = [expected_errors(report) for report in reports]
+    assert sum(1 for errors in expected if errors) == COUNT * 2 // 3
+
+    for processes in (1, 2, 4):
+        results = validate_many(
+            reports, processes, schema_cache=SCHEMA_CACHE, chunksize=7
+        )
+        assert len(results) == len(reports), len(results)
+        for (index, errors) in enumerate(results):
+            assert ', '.join(errors) == expected[index], \
+                (processes, index, errors, expected[index])
+        print('validate_many(processes=%d): %d reports, same errors in '
+              'input order' % (processes, len(reports)))
@@ -0,0 +1,337 @@
+#!/usr/bin/env python
+'''
+checks schema loading against a local http server, run from the
+repository root:
+
+    python tests/testregistry.py
+
+'''
+from __future__ import print_function
+
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from os.path import abspath, dirname
+
+ROOT = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+from pyxarf import SchemaRegistry
+from pyxarf.cache import SchemaCache
+from pyxarf.exceptions import GeneralError
+
+SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'Source': {'type': 'string'},
+        'Port': {'type': 'integer', 'optional': True},
+    },
+}
+ETAG = '"schema-1"'
+# seconds the server takes to answer /slow/ and /hang/ requests
+SLOW = 0.3
+HANG = 3
+
+
+class SchemaServer(ThreadingMixIn, HTTPServer):
+    '''
+    serves SCHEMA for every path and counts requests and connections
+    '''
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), SchemaHandler)
+        self.requests = []
+        self.conditional = []
+        self.connections = set()
+        self.failing = False
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self.server_address[1]
+
+    def reset(self):
+        with self.lock:
+            self.requests = []
+            self.conditional = []
+            self.connections = set()
+            self.failing = False
+            self.max_active = 0
+
+
+class SchemaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests.append(self.path)
+            self.server.connections.add(self.client_address)
+            if self.headers.get('If-None-Match'):
+                self.server.conditional.append(self.path)
+            self.server.active += 1
+            self.server.max_active = max(
+                self.server.max_active, self.server.active
+            )
+
+        try:
+            self.respond()
+        finally:
+            with self.server.lock:
+                self.server.active -= 1
+
+    def respond(self):
+        if self.path.startswith('/slow/'):
+            time.sleep(SLOW)
+        elif self.path.startswith('/hang/'):
+            time.sleep(HANG)
+
+        if self.server.failing:
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if self.headers.get('If-None-Match') == ETAG:
+            self.send_response(304)
+            self.send_header('ETag', ETAG)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        body = json.dumps(SCHEMA).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('ETag', ETAG)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server():
+    server = SchemaServer()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def aload_coalescing(server, callers=20):
+    registry = SchemaRegistry()
+    url = server.url + '/slow/coalesced.json'
+
+    async def load_all():
+        return await asyncio.gather(*[
+            registry.aload(url) for _ in range(callers)
+        ])
+
+    entries = asyncio.run(load_all())
+    assert len(server.requests) == 1, server.requests
+    assert all(entry is entries[0] for entry in entries)
+    assert entries[0].required_keys == {'Source': ''}
+    assert not registry._pending
+    print('aload: %d concurrent callers, 1 request' % callers)
+
+
+def failed_load_serialized(server, callers=6):
+    registry = SchemaRegistry()
+    url = server.url + '/slow/failing.json'
+    server.failing = True
+    errors = []
+
+    def load():
+        try:
+            registry.get(url)
+        except GeneralError as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=load) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+        # later callers arrive after the first download failed
+        time.sleep(SLOW * 0.6)
+    for thread in threads:
+        thread.join()
+
+    # callers retry one after another, never in parallel
+    assert len(errors) == callers, errors
+    assert server.max_active == 1, server.max_active
+    assert not registry._url_locks
+    print('failures: %d callers, at most 1 download at a time' % callers)
+
+
+def session_reuse(server, count=5):
+    registry = SchemaRegistry()
+    for i in range(count):
+        registry.get(server.url + '/schema_%d.json' % i)
+
+    assert len(server.requests) == count, server.requests
+    assert len(server.connections) == 1, server.connections
+    assert registry.stats()['size'] == count
+    print('session: %d downloads, 1 connection' % count)
+
+
+def download_timeout(server, timeout=0.2):
+    registry = SchemaRegistry(timeout=timeout)
+    started = time.time()
+    try:
+        registry.get(server.url + '/hang/timeout.json')
+    except GeneralError:
+        pass
+    else:
+        raise AssertionError('no timeout')
+    seconds = time.time() - started
+
+    assert seconds < HANG / 2.0, seconds
+    assert len(registry) == 0
+    print('timeout: gave up after %.2fs' % seconds)
+
+
+def conditional_revalidation(server):
+    cache = tempfile.mkdtemp()
+    url = server.url + '/revalidated.json'
+    path = os.path.join(cache, 'revalidated.json')
+    try:
+        # cache_ttl=0 revalidates on every load
+        SchemaRegistry(cache_ttl=0).get(url, cache)
+        stat = os.stat(path)
+        with open(path + '.meta') as f:
+            fetched = json.load(f)['fetched']
+        assert server.conditional == [], server.conditional
+
+        time.sleep(0.01)
+        entry = SchemaRegistry(cache_ttl=0).get(url, cache)
+        assert server.conditional == ['/revalidated.json'], server.requests
+        assert entry.required_keys == {'Source': ''}
+
+        # 304: the schema is not rewritten, only its metadata
+        assert os.stat(path).st_ino == stat.st_ino
+        assert os.stat(path).st_mtime == stat.st_mtime
+        with open(path + '.meta') as f:
+            assert json.load(f)['fetched'] > fetched
+    finally:
+        shutil.rmtree(cache)
+    print('revalidation: 304 kept the cached schema file')
+
+
+def failed_revalidation(server):
+    cache = tempfile.mkdtemp()
+    url = server.url + '/offline.json'
+    try:
+        SchemaRegistry(cache_ttl=0).get(url, cache)
+        server.failing = True
+
+        # the stale copy is used and the failure recorded in its sidecar
+        entry = SchemaRegistry(cache_ttl=0).get(url, cache)
+        assert entry.required_keys == {'Source': ''}
+        with open(os.path.join(cache, 'offline.json.meta')) as f:
+            assert json.load(f)['retry_after'] > time.time()
+
+        # later loads do not ask the server again until retry_after
+        for _ in range(3):
+            SchemaRegistry(cache_ttl=0).get(url, cache)
+        assert len(server.requests) == 2, server.requests
+    finally:
+        shutil.rmtree(cache)
+    print('offline: failed revalidation not retried before retry_after')
+
+
+def stale_copy_unlocked(server):
+    cache = tempfile.mkdtemp()
+    url = server.url + '/slow/stale.json'
+    try:
+        SchemaRegistry(cache_ttl=0).get(url, cache)
+        server.reset()
+
+        # another process holds the lock while it revalidates
+        with SchemaCache(cache).lock('stale.json'):
+            started = time.time()
+            entry = SchemaRegistry(cache_ttl=0).get(url, cache)
+            seconds = time.time() - started
+    finally:
+        shutil.rmtree(cache)
+
+    assert entry.required_keys == {'Source': ''}
+    assert server.requests == [], server.requests
+    assert seconds < SLOW, seconds
+    print('stale: used the cached copy after %.3fs instead of waiting'
+          % seconds)
+
+
+def without_fcntl(server):
+    cache = tempfile.mkdtemp()
+    code = (
+        'import sys; sys.path.insert(0, %r)\n'
+        'sys.modules["fcntl"] = None\n'
+        'from pyxarf.registry import download_schema\n'
+        'download_schema(sys.argv[1], sys.argv[2])\n' % ROOT
+    )
+    try:
+        subprocess.check_call([
+            sys.executable, '-c', code, server.url + '/nofcntl.json', cache
+        ])
+        assert os.path.isfile(os.path.join(cache, 'nofcntl.json'))
+    finally:
+        shutil.rmtree(cache)
+    print('fcntl: schemas are cached without file locks')
+
+
+def cross_process_lock(server, processes=8):
+    cache = tempfile.mkdtemp()
+    code = (
+        'import sys; sys.path.insert(0, %r)\n'
+        'from pyxarf.registry import download_schema\n'
+        'download_schema(sys.argv[1], sys.argv[2])\n' % ROOT
+    )
+    url = server.url + '/slow/locked.json'
+    try:
+        children = [
+            subprocess.Popen([sys.executable, '-c', code, url, cache])
+            for _ in range(processes)
+        ]
+        codes = [child.wait() for child in children]
+        assert codes == [0] * processes, codes
+    finally:
+        shutil.rmtree(cache)
+
+    assert len(server.requests) == 1, server.requests
+    print('lock: %d cold processes, 1 request' % processes)
+
+
+if __name__ == '__main__':
+    server = start_server()
+
+    for check in (
+        aload_coalescing,
+        failed_load_serialized,
+        session_reuse,
+        download_timeout,
+        conditional_revalidation,
+        failed_revalidation,
+        stale_copy_unlocked,
+        without_fcntl,
+        cross_process_lock,
+    ):
+        server.reset()
+        check(server)
+
+    server.shutdown()
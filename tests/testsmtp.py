@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+'''
+checks persistent and pooled smtp connections against a local aiosmtpd
+mail server, run from the repository root:
+
+    python tests/testsmtp.py
+
+'''
+from __future__ import print_function
+
+import asyncio
+import socket
+import sys
+import time
+
+from os.path import abspath, dirname
+
+ROOT = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from aiosmtpd.controller import Controller
+
+from xarfmail import SMTP, SMTPPool
+from xarfmail.aio import AsyncSender
+
+MAIL_FROM = 'xarf@example.org'
+
+
+class Handler(object):
+    '''
+    records delivered mails and the smtp sessions they came through.
+    mails to slow-<n>@... are answered after n tenths of a second,
+    recipients starting with refused are rejected.
+    '''
+    def __init__(self):
+        self.mails = []
+        self.sessions = set()
+
+    async def handle_RCPT(self, server, session, envelope, address, options):
+        if address.startswith('refused'):
+            return '550 no such user'
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        recipient = envelope.rcpt_tos[0]
+        if recipient.startswith('slow-'):
+            await asyncio.sleep(int(recipient[5:].split('@')[0]) / 10.0)
+        self.sessions.add(id(session))
+        self.mails.append((recipient, envelope.content))
+        return '250 OK'
+
+
+class Mail(object):
+    '''
+    minimal mail streamed with write_to like XarfMail
+    '''
+    def __init__(self, mail_to, text):
+        self.mail_from = MAIL_FROM
+        self.mail_to = mail_to
+        self.text = text
+
+    def write_to(self, fileobj):
+        fileobj.write(('Subject: test\r\n\r\n%s\r\n' % self.text).encode())
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def start_server(port):
+    controller = Controller(Handler(), hostname='127.0.0.1', port=port)
+    controller.start()
+    return controller
+
+
+def reuse(port):
+    controller = start_server(port)
+    try:
+        with SMTP('127.0.0.1', port) as smtp:
+            for i in range(5):
+                smtp.send(MAIL_FROM, 'abuse@example.com', Mail('', i))
+        with SMTPPool('127.0.0.1', port, size=2) as pool:
+            for i in range(5):
+                pool.send(MAIL_FROM, 'abuse@example.com', Mail('', i))
+    finally:
+        controller.stop()
+
+    handler = controller.handler
+    assert len(handler.mails) == 10, handler.mails
+    assert len(handler.sessions) == 2, handler.sessions
+    print('reuse: 10 mails over 2 connections')
+
+
+def reconnect(port):
+    controller = start_server(port)
+    smtp = SMTP('127.0.0.1', port)
+    smtp.connect()
+    try:
+        smtp.send(MAIL_FROM, 'abuse@example.com', Mail('', 'first'))
+        # the restarted server dropped the persistent connection
+        controller.stop()
+        controller = start_server(port)
+        smtp.send(MAIL_FROM, 'abuse@example.com', Mail('', 'second'))
+    finally:
+        smtp.close()
+        controller.stop()
+
+    assert len(controller.handler.mails) == 1
+    assert b'second' in controller.handler.mails[0][1]
+    print('reconnect: sent again after the server closed the connection')
+
+
+class BrokenMail(Mail):
+    '''
+    mail whose evidence file vanished while it was streamed
+    '''
+    def write_to(self, fileobj):
+        fileobj.write(b'Subject: test\r\n\r\n')
+        open('/nonexistent/evidence.txt')
+
+
+def broken_mail(port):
+    controller = start_server(port)
+    try:
+        with SMTP('127.0.0.1', port) as smtp:
+            try:
+                smtp.send(MAIL_FROM, 'abuse@example.com', BrokenMail('', 0))
+            except (IOError, OSError):
+                pass
+            else:
+                raise AssertionError('no error')
+            smtp.send(MAIL_FROM, 'abuse@example.com', Mail('', 'next'))
+    finally:
+        controller.stop()
+
+    # the broken mail was neither resent nor mixed into the next one
+    mails = controller.handler.mails
+    assert len(mails) == 1, mails
+    assert mails[0][1] == b'Subject: test\r\n\r\nnext\r\n', mails
+    print('broken mail: not resent, next mail on a new connection')
+
+
+def idle_expiry(port):
+    controller = start_server(port)
+    try:
+        with SMTPPool('127.0.0.1', port, size=1, idle_timeout=0.2) as pool:
+            pool.send(MAIL_FROM, 'abuse@example.com', Mail('', 1))
+            pool.send(MAIL_FROM, 'abuse@example.com', Mail('', 2))
+            time.sleep(0.3)
+            pool.send(MAIL_FROM, 'abuse@example.com', Mail('', 3))
+    finally:
+        controller.stop()
+
+    assert len(controller.handler.sessions) == 2
+    print('idle: connection reopened after idle_timeout')
+
+
+def send_many_order(port):
+    controller = start_server(port)
+    delays = [5, 0, 3, 1, 4, 0, 2, 0]
+    mails = [
+        Mail('slow-%d@example.com' % delay, index)
+        for (index, delay) in enumerate(delays)
+    ]
+    mails.append(Mail('refused@example.com', 'refused'))
+    try:
+        with SMTPPool('127.0.0.1', port, size=3) as pool:
+            results = pool.send_many(mails)
+    finally:
+        controller.stop()
+
+    assert [result.index for result in results] == list(range(len(mails)))
+    assert [result.mail for result in results] == mails
+    assert all(result.error is None for result in results[:-1])
+    assert results[-1].error is not None
+    # mails finished out of order on the 3 connections
+    received = [mail[0] for mail in controller.handler.mails]
+    assert received != [mail.mail_to for mail in mails[:-1]], received
+    print('send_many: %d results in input order' % len(results))
+
+
+def async_sender(port):
+    controller = start_server(port)
+    mails = [Mail('slow-2@slow.example', i) for i in range(4)]
+    mails += [Mail('fast-%d@fast.example' % i, i) for i in range(4)]
+    mails.append(Mail(None, 'no recipient'))
+    sender = AsyncSender(
+        SMTPPool('127.0.0.1', port, size=2), per_domain=1, max_pending=2
+    )
+    try:
+        results = asyncio.run(asyncio.wait_for(sender.deliver(mails), 10))
+    finally:
+        sender.close()
+        controller.stop()
+
+    assert [result.index for result in results] == list(range(len(mails)))
+    assert all(result.error is None for result in results[:-1])
+    assert isinstance(results[-1].error, AttributeError), results[-1]
+    assert len(controller.handler.mails) == len(mails) - 1
+    print('async: %d results, invalid recipient reported' % len(results))
+
+
+def async_slow_domain(port):
+    controller = start_server(port)
+    # 3 mails taking a second each to one domain, then 20 fast ones
+    mails = [Mail('slow-10@slow.example', i) for i in range(3)]
+    mails += [Mail('fast@fast-%d.example' % i, i) for i in range(20)]
+    sender = AsyncSender(
+        SMTPPool('127.0.0.1', port, size=8), per_domain=2, max_pending=100
+    )
+
+    async def deliver():
+        started = time.time()
+        finished = []
+        async for result in sender.deliver_iter(mails):
+            assert result.error is None, result
+            finished.append((result.index, time.time() - started))
+        return finished
+
+    try:
+        finished = asyncio.run(asyncio.wait_for(deliver(), 10))
+    finally:
+        sender.close()
+        controller.stop()
+
+    order = [index for (index, seconds) in finished]
+    assert sorted(order[:20]) == list(range(3, 23)), order
+    last_fast = max(seconds for (index, seconds) in finished if index >= 3)
+    assert last_fast < 0.9, finished
+    print('async: fast domains done after %.2fs, not held back by a '
+          'slow one' % last_fast)
+
+
+def connect_timeout(timeout=0.3):
+    # accepts connections but never sends the smtp greeting
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(5)
+    port = listener.getsockname()[1]
+
+    started = time.time()
+    try:
+        SMTP('127.0.0.1', port, timeout=timeout).connect()
+    except (socket.error, socket.timeout):
+        pass
+    else:
+        raise AssertionError('no timeout')
+    finally:
+        listener.close()
+
+    seconds = time.time() - started
+    assert seconds < 2, seconds
+    print('timeout: gave up after %.2fs' % seconds)
+
+
+if __name__ == '__main__':
+    for check in (
+        reuse, reconnect, broken_mail, idle_expiry, send_many_order,
+        async_sender, async_slow_domain,
+    ):
+        check(free_port())
+    connect_timeout()
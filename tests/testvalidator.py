@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+'''
+checks that compiled schemas report the same errors as the draft03
+validator of jsonschema and compares their speed, run from the
+repository root:
+
+    python tests/testvalidator.py
+
+'''
+from __future__ import print_function
+
+import copy
+import random
+import sys
+import timeit
+
+from os.path import abspath, dirname
+
+ROOT = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from jsonschema.validators import Draft3Validator
+
+from pyxarf.compiled import compile_schema
+from pyxarf.registry import convert_schema
+
+# draft02 schema like abuse_login-attack_0.1.2.json
+LOGIN_ATTACK = {
+    'type': 'object',
+    '$schema': 'http://json-schema.org/draft-02/schema#',
+    'properties': {
+        'Reported-From': {'type': 'string', 'format': 'email'},
+        'Category': {'type': 'string', 'enum': ['abuse']},
+        'Report-Type': {'type': 'string', 'enum': ['login-attack']},
+        'Service': {'type': 'string'},
+        'Version': {'type': 'string', 'optional': True},
+        'User-Agent': {'type': 'string', 'optional': True},
+        'Date': {'type': 'string', 'format': 'date-time'},
+        'Source-Type': {'type': 'string', 'enum': ['ip-address']},
+        'Source': {'type': 'string', 'format': 'ip-address'},
+        'Destination': {
+            'type': 'string', 'optional': True,
+            'requires': 'Destination-Type',
+        },
+        'Destination-Type': {
+            'type': 'string', 'optional': True, 'enum': ['ip-address'],
+        },
+        'Port': {'type': 'integer', 'minimum': 1, 'maximum': 65535},
+        'Report-ID': {'type': 'string'},
+        'Schema-URL': {'type': 'string', 'format': 'uri'},
+        'Attachment': {'type': 'string', 'enum': ['text/plain', 'none']},
+        'Occurrences': {'type': 'integer', 'optional': True},
+        'TLP': {
+            'type': 'string', 'optional': True,
+            'enum': ['red', 'amber', 'green', 'white'],
+        },
+    },
+}
+
+# every compiled keyword and type
+ALL_TYPES = {
+    'type': 'object',
+    'properties': {
+        'Count': {'type': 'number', 'minimum': 0, 'exclusiveMinimum': True},
+        'Ratio': {'type': 'number', 'maximum': 1.5, 'exclusiveMaximum': True},
+        'Percent-%': {'type': 'integer', 'maximum': 100},
+        'Flag': {'type': 'boolean', 'optional': True},
+        'Empty': {'type': 'null', 'optional': True},
+        'Anything': {'type': 'any', 'description': 'free text'},
+        'Untyped': {'enum': ['a', 'b%s']},
+        'Bounded': {'minimum': -2.5, 'maximum': 2, 'optional': True},
+    },
+}
+
+UNSUPPORTED = [
+    {'type': 'object', 'properties': {'A': {'type': ['string', 'null']}}},
+    {'type': 'object', 'properties': {'A': {'type': 'array'}}},
+    {'type': 'object', 'properties': {'A': {'enum': [1, 2]}}},
+    {'type': 'object', 'properties': {'A': {'pattern': '^a'}}},
+    {'type': 'object', 'properties': {'A': {'$ref': '#'}}},
+    {'type': 'object', 'additionalProperties': False, 'properties': {}},
+    {'type': 'array'},
+]
+
+VALUES = [
+    '', 'abuse', 'login-attack', 'ip-address', 'text/plain', 'none', 'red',
+    'a', 'b%s', 'x' * 100, u'\xe9', '1', 0, 1, -1, 22, 65535, 65536, 100,
+    101, 2, 3, -3, 0.0, 0.5, 1.5, 2.0, -2.5, 1e300, True, False, None,
+]
+
+NON_SCALARS = [[], {}, ['abuse'], {'a': 1}]
+
+COUNT = 20000
+
+
+def expected_errors(validator, instance):
+    return [
+        '%s %s' % (error.path[0], error.message)
+        for error in validator.iter_errors(instance)
+    ]
+
+
+def instances(schema, count, rng):
+    properties = list(schema['properties'])
+    for _ in range(count):
+        instance = {}
+        for name in properties:
+            if rng.random() < 0.8:
+                instance[name] = rng.choice(VALUES)
+        if rng.random() < 0.1:
+            instance['Unknown'] = rng.choice(VALUES)
+        yield instance
+
+
+def differential(draft02, count=COUNT):
+    (schema, required_keys) = convert_schema(copy.deepcopy(draft02))
+    check = compile_schema(schema)
+    assert check is not None, schema
+    validator = Draft3Validator(schema)
+
+    rng = random.Random(4)
+    for instance in instances(schema, count, rng):
+        assert check(instance) == expected_errors(validator, instance), \
+            (instance, check(instance), expected_errors(validator, instance))
+
+    for value in NON_SCALARS:
+        assert check({'Anything': value, 'Port': value}) is None
+    return (schema, check, validator)
+
+
+def speed(schema, check, validator):
+    instance = dict((name, 'abuse') for name in schema['properties'])
+    instance.update(
+        Category='abuse', Port=22, Attachment='text/plain', TLP='red'
+    )
+    instance = dict(
+        (name, value) for (name, value) in instance.items()
+        if name in schema['properties']
+    )
+
+    compiled = min(timeit.repeat(
+        lambda: check(instance), number=COUNT, repeat=3
+    ))
+    generic = min(timeit.repeat(
+        lambda: list(validator.iter_errors(instance)), number=COUNT, repeat=3
+    ))
+    return (COUNT / compiled, COUNT / generic)
+
+
+if __name__ == '__main__':
+    for schema in UNSUPPORTED:
+        assert compile_schema(schema) is None, schema
+
+    differential(ALL_TYPES)
+    (compiled, generic) = speed(*differential(LOGIN_ATTACK))
+
+    print('%d random reports per schema, same errors as jsonschema' % COUNT)
+    print('%-32s %10.0f reports/s' % ('compiled schema', compiled))
+    print('%-32s %10.0f reports/s' % ('Draft3Validator', generic))
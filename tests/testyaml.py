@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+'''
+checks that the yaml written by pyxarf matches yaml.dump byte for byte,
+run from the repository root:
+
+    python tests/testyaml.py
+
+'''
+from __future__ import print_function
+
+import sys
+
+from os.path import abspath, dirname
+
+ROOT = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import yaml
+
+from pyxarf.emitter import dump_flat_mapping, dump_yaml
+
+# machine readable part of the login-attack sample report
+GOLDEN_MAPPING = {
+    'Reported-From': 'reporter@example.com',
+    'Category': 'abuse',
+    'Report-Type': 'login-attack',
+    'Service': 'ssh',
+    'Date': 'Jan  1 2014 02:13:35 +0100',
+    'Source-Type': 'ip-address',
+    'Source': '83.169.54.26',
+    'Port': 22,
+    'Report-ID': '1231231',
+    'Schema-URL': 'http://xarf.org/schema/abuse_login-attack_0.1.2.json',
+    'Attachment': 'text/plain',
+    'User-Agent': 'pyxarf 0.0.5',
+}
+GOLDEN_OUTPUT = '''Attachment: text/plain
+Category: abuse
+Date: Jan  1 2014 02:13:35 +0100
+Port: 22
+Report-ID: '1231231'
+Report-Type: login-attack
+Reported-From: reporter@example.com
+Schema-URL: http://xarf.org/schema/abuse_login-attack_0.1.2.json
+Service: ssh
+Source: 83.169.54.26
+Source-Type: ip-address
+User-Agent: pyxarf 0.0.5
+'''
+
+# values of every type a schema field can have, written plain, quoted
+# or not supported by the direct emitter
+VALUES = [
+    # strings
+    'abuse', 'login-attack', 'ip-address', '83.169.54.26', '2001:db8::1',
+    '10.0.0.0/8', 'reporter@example.com', 'text/plain', 'none',
+    'http://xarf.org/schema/abuse_login-attack_0.1.2.json',
+    'Jan  1 2014 02:13:35 +0100', '2014-01-01T02:13:35+01:00',
+    '2014-01-01', '02:13:35', '1231231', '0x1F', '1_000', '+1', '-1',
+    '.5', '1e3', '1.0', '.inf', '.NaN', 'yes', 'No', 'on', 'OFF', 'true',
+    'False', 'null', 'Null', '~', '', ' ', '-', '-a', '- a', '?', '?a',
+    ':', ':a', 'a:', 'a:b', 'a: b', 'a#b', 'a #b', '#a', 'a,b', '[a',
+    'a]', '{a}', '&a', '*a', '!a', '|a', '>a', "'a", '"a', '%a', '@a',
+    '`a', 'a|b', 'a>b', "it's", 'a"b', '<', '<<', '=', '==', '---', '...',
+    '--a', 'a  ', '  a', 'a  b', 'a\tb', 'a\nb', u'\xe9', 'x' * 73,
+    'x' * 74, 'x ' * 40, "'" * 30,
+    # integers, floats, booleans and null
+    0, 22, -1, 2 ** 40, 0.0, 1.5, -0.25, 1e17, 1e-07, float('inf'),
+    float('-inf'), float('nan'), True, False, None,
+]
+
+
+def check(mapping):
+    expected = yaml.dump(mapping, default_flow_style=False)
+    output = dump_flat_mapping(mapping)
+    assert output is None or output == expected, (mapping, output, expected)
+    assert dump_yaml(mapping) == expected, (mapping, dump_yaml(mapping))
+    return output is not None
+
+
+if __name__ == '__main__':
+    assert dump_flat_mapping(GOLDEN_MAPPING) == GOLDEN_OUTPUT
+    assert yaml.dump(GOLDEN_MAPPING, default_flow_style=False) == \
+        GOLDEN_OUTPUT
+
+    direct = sum(check({'Key': value}) for value in VALUES)
+    check(dict(('Key-%d' % i, value) for (i, value) in enumerate(VALUES)))
+    check(dict(GOLDEN_MAPPING, Evidence='line one\nline two\n' * 50))
+
+    print('%d of %d values written directly, all identical to yaml.dump'
+          % (direct, len(VALUES)))
@@ -1 +1,5 @@
-from xarfmail.xarfmail import SMTP, XarfMail, MultiPartMail, lookup_contact
+from xarfmail.xarfmail import SMTP, SMTPPool, XarfMail, XarfDigestMail, \
+    XarfMailTemplate, MultiPartMail, DeliveryResult, lookup_contact, \
+    lookup_contacts
+from xarfmail.aggregate import ReportAggregator
+from xarfmail.contacts import ContactResolver
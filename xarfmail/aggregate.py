@@ -0,0 +1,202 @@
+'''
+Grouping of X-ARF reports by abuse contact, so every contact gets one
+E-Mail per time window instead of one E-Mail per report.
+'''
+from collections import OrderedDict
+from time import time
+
+from xarfmail.xarfmail import XarfDigestMail, XarfMailTemplate, \
+    _join_mail_to, lookup_contact
+
+
+class _Group(object):
+    '''
+    Pending reports for one set of recipients.
+    '''
+    __slots__ = ('mail_to', 'started', 'reports')
+
+    def __init__(self, mail_to):
+        self.mail_to = mail_to
+        self.started = time()
+        self.reports = []
+
+
+class ReportAggregator(object):
+    '''
+    Collects X-ARF reports and groups them by abuse contact. A group is
+    due once window seconds have passed since its first report or it
+    holds max_reports reports.
+
+    Due groups are turned into one :py:class:`XarfDigestMail` per
+    contact or, if digest is False, into the individual E-Mails of the
+    group, rendered by a :py:class:`XarfMailTemplate`. These should be
+    sent over one persistent connection (see :py:class:`SMTP`).
+
+    The contact of a report is resolved from its source ip address,
+    once per address, unless a recipient is passed explicitly. Reports
+    without a contact are kept in unresolved, reports failing validation
+    are kept in rejected as (report, error) tuples.
+
+    :param mail_from: Sender E-Mail address
+    :type mail_from: str
+    :param subject: Subject of Network Abuse Report
+    :type subject: str
+    :param greeting: Human readable text for the first MIME part
+    :type greeting: unicode
+    :param window: Seconds to collect reports for a contact
+    :type window: float
+    :param max_reports: Maximum number of reports per E-Mail
+    :type max_reports: int
+    :param digest: Build one digest E-Mail per contact
+    :type digest: bool
+    :param resolve: Callable returning the contacts for an ip address
+        (default: :py:func:`lookup_contact`)
+    :type resolve: callable
+    '''
+
+    def __init__(
+        self, mail_from, subject, greeting, window=300, max_reports=100,
+        digest=True, resolve=None
+    ):
+        self.mail_from = mail_from
+        self.subject = subject
+        self.greeting = greeting
+        self.window = window
+        self.max_reports = max_reports
+        self.digest = digest
+        self.resolve = resolve or lookup_contact
+
+        self._template = XarfMailTemplate(mail_from, subject, greeting)
+
+        self.unresolved = []
+        self.rejected = []
+        self._groups = OrderedDict()
+        self._contacts = {}
+
+    def __len__(self):
+        return sum(len(group.reports) for group in self._groups.values())
+
+    def _resolve(self, xarf):
+        '''
+        Look up the contacts of the report's source ip address.
+
+        :returns: sorted contacts or None
+        :rtype: tuple
+        '''
+        machine_readable = xarf.machine_readable
+        if machine_readable.get('Source-Type', '')[:2] != 'ip':
+            return None
+
+        ip = machine_readable['Source']
+        if ip not in self._contacts:
+            try:
+                contacts = self.resolve(ip)
+            except ImportError:
+                raise
+            except Exception:
+                contacts = None
+
+            if isinstance(contacts, str):
+                contacts = [contacts]
+            self._contacts[ip] = tuple(sorted(contacts)) if contacts else None
+
+        return self._contacts[ip]
+
+    def add(self, xarf, mail_to=None):
+        '''
+        Add a report to the group of its contact.
+
+        :param xarf: X-ARF object to report
+        :type xarf: :py:class:`Xarf`
+        :param mail_to: Recipient(s), overrides the contact lookup
+        :type mail_to: str or list
+
+        :returns: E-Mails of all groups which became due
+        :rtype: list
+
+        :raises: :py:class:`email.errors.HeaderParseError` if mail_to
+            contains a line break
+        '''
+        if mail_to is not None:
+            _join_mail_to(mail_to)
+
+        # validate now, so a bad report cannot break its group later
+        try:
+            xarf.get_report_obj('machine_readable')
+        except Exception as error:
+            self.rejected.append((xarf, error))
+            return self.due()
+
+        if mail_to is not None:
+            key = tuple(mail_to) if isinstance(mail_to, list) else (mail_to,)
+        else:
+            key = self._resolve(xarf)
+
+        if not key:
+            self.unresolved.append(xarf)
+        else:
+            if key not in self._groups:
+                self._groups[key] = _Group(list(key))
+            self._groups[key].reports.append(xarf)
+
+        return self.due()
+
+    def due(self):
+        '''
+        Take all due groups out of the aggregator.
+
+        :returns: E-Mails of the due groups
+        :rtype: list
+        '''
+        now = time()
+        return self._take([
+            key for (key, group) in self._groups.items()
+            if len(group.reports) >= self.max_reports or
+            now - group.started >= self.window
+        ])
+
+    def flush(self):
+        '''
+        Take all groups out of the aggregator, due or not.
+
+        :returns: E-Mails of all groups
+        :rtype: list
+        '''
+        return self._take(list(self._groups))
+
+    def _take(self, keys):
+        '''
+        Build the E-Mails of the given groups and remove them. If an
+        E-Mail cannot be built, all groups are kept.
+
+        :returns: E-Mails of the groups
+        :rtype: list
+        '''
+        mails = []
+        for key in keys:
+            group = self._groups[key]
+            mail_to = group.mail_to
+            if len(mail_to) == 1:
+                mail_to = mail_to[0]
+
+            for start in range(0, len(group.reports), self.max_reports):
+                reports = group.reports[start:start + self.max_reports]
+                if self.digest:
+                    mails.append(XarfDigestMail(
+                        reports, self.mail_from, mail_to, self.subject,
+                        self.greeting,
+                    ))
+                else:
+                    mails.extend(
+                        self._template.render(xarf, mail_to)
+                        for xarf in reports
+                    )
+
+        for key in keys:
+            del self._groups[key]
+
+        # contacts are only remembered while reports are pending
+        if not self._groups:
+            self._contacts.clear()
+
+        return mails
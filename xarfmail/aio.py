@@ -0,0 +1,263 @@
+'''
+asyncio pipeline for delivering X-ARF E-Mails, requires python 3.7
+'''
+import asyncio
+import smtplib
+import socket
+
+from concurrent.futures import ThreadPoolExecutor
+from xarfmail.xarfmail import DeliveryResult, SMTPException, \
+    _is_connection_error
+
+
+def _is_transient(error):
+    '''
+    Check if delivery failed temporarily and should be retried, which
+    is the case for 4xx replies and lost connections.
+
+    :param error: delivery error
+    :type error: :py:class:`Exception`
+
+    :returns: True if the delivery should be retried
+    :rtype: bool
+    '''
+    if _is_connection_error(error) or isinstance(error, socket.timeout):
+        return True
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        refused = error.recipients.values()
+    elif isinstance(error, SMTPException) and isinstance(error.args[0], dict):
+        refused = error.args[0].values()
+    else:
+        return False
+    return all(400 <= code < 500 for (code, message) in refused)
+
+
+def _get_domain(mail_to):
+    '''
+    Return the domain of the first recipient.
+
+    :param mail_to: Recipient E-Mail address(es)
+    :type mail_to: str or list
+
+    :returns: lower case domain
+    :rtype: str
+    '''
+    if isinstance(mail_to, list):
+        mail_to = mail_to[0]
+    return mail_to.split(',')[0].rpartition('@')[-1].strip().lower()
+
+
+class _Done(object):
+    '''
+    Marks the end of the input, optionally with the error raised while
+    reading it.
+    '''
+    def __init__(self, count, error=None):
+        self.count = count
+        self.error = error
+
+
+class AsyncSender(object):
+    '''
+    Delivers X-ARF E-Mails from an (async) iterable over the connections
+    of a :py:class:`SMTPPool` without blocking the event loop.
+
+    At most per_domain E-Mails to the same recipient domain are
+    delivered at a time, so a slow destination only holds back its own
+    E-Mails. Temporary failures (4xx replies, lost connections) are
+    retried with exponential backoff. No more than max_pending E-Mails
+    are read from the input ahead of their delivery.
+
+    :param pool: Pool of SMTP connections to deliver over
+    :type pool: :py:class:`SMTPPool`
+    :param per_domain: Concurrent deliveries per recipient domain
+    :type per_domain: int
+    :param max_pending: Maximum number of undelivered E-Mails in memory
+    :type max_pending: int
+    :param retries: Number of retries after temporary failures
+    :type retries: int
+    :param backoff: Seconds to wait before the first retry, doubling
+        with every further retry
+    :type backoff: float
+    '''
+
+    def __init__(
+        self, pool, per_domain=2, max_pending=1000, retries=3, backoff=1.0
+    ):
+        self.pool = pool
+        self.per_domain = per_domain
+        self.max_pending = max_pending
+        self.retries = retries
+        self.backoff = backoff
+
+        # one thread per connection, blocking sends never starve others
+        self._executor = ThreadPoolExecutor(max_workers=pool.size)
+
+    def _get_slot(self, mail, domain_slots):
+        '''
+        Return the semaphore limiting deliveries to the recipient domain
+        of the given E-Mail.
+        '''
+        domain = _get_domain(mail.mail_to)
+        if domain not in domain_slots:
+            domain_slots[domain] = asyncio.Semaphore(self.per_domain)
+        return domain_slots[domain]
+
+    async def _deliver(self, mail, index, slot):
+        '''
+        Deliver a single E-Mail, retrying temporary failures. The domain
+        slot is held on entry and released on return.
+        '''
+        loop = asyncio.get_running_loop()
+        held = True
+        attempt = 0
+        try:
+            while True:
+                try:
+                    await loop.run_in_executor(
+                        self._executor,
+                        self.pool.send,
+                        mail.mail_from,
+                        mail.mail_to,
+                        mail,
+                    )
+                    return DeliveryResult(index, mail, None)
+                except Exception as error:
+                    if attempt >= self.retries or not _is_transient(error):
+                        return DeliveryResult(index, mail, error)
+
+                # the domain slot is free for other E-Mails while waiting
+                slot.release()
+                held = False
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+                await slot.acquire()
+                held = True
+                attempt += 1
+        finally:
+            if held:
+                slot.release()
+
+    async def send(self, mail, index=0, domain_slots=None):
+        '''
+        Deliver a single E-Mail, retrying temporary failures.
+
+        :param mail: E-Mail to deliver
+        :type mail: :py:class:`XarfMail`
+        :param index: Position of the E-Mail in its batch
+        :type index: int
+        :param domain_slots: Semaphores limiting deliveries per domain
+        :type domain_slots: dict
+
+        :returns: Outcome of the delivery
+        :rtype: :py:class:`DeliveryResult`
+        '''
+        if domain_slots is None:
+            domain_slots = {}
+        try:
+            slot = self._get_slot(mail, domain_slots)
+        except Exception as error:
+            return DeliveryResult(index, mail, error)
+
+        await slot.acquire()
+        return await self._deliver(mail, index, slot)
+
+    async def deliver_iter(self, mails):
+        '''
+        Deliver the given E-Mails and yield their outcomes in order of
+        completion.
+
+        Only max_pending limits reading the input. E-Mails wait for a
+        slot of their recipient domain after being read, so a slow
+        domain holds back its own E-Mails but not those to other
+        domains. E-Mails that cannot be delivered at all, e.g. without
+        a recipient, yield an error result.
+
+        :param mails: E-Mails to deliver
+        :type mails: async iterable or iterable of :py:class:`XarfMail`
+
+        :returns: async generator of :py:class:`DeliveryResult`
+        :rtype: async generator
+        '''
+        loop = asyncio.get_running_loop()
+        results = asyncio.Queue()
+        pending = asyncio.Semaphore(self.max_pending)
+        domain_slots = {}
+        tasks = set()
+
+        async def run(index, mail):
+            # waiting for the domain slot happens here, not in produce,
+            # so a busy domain never stops reading mails for others
+            try:
+                slot = self._get_slot(mail, domain_slots)
+                await slot.acquire()
+                result = await self._deliver(mail, index, slot)
+            except Exception as error:
+                result = DeliveryResult(index, mail, error)
+            finally:
+                pending.release()
+            await results.put(result)
+
+        async def start(index, mail):
+            await pending.acquire()
+            task = loop.create_task(run(index, mail))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        async def produce():
+            count = 0
+            try:
+                if hasattr(mails, '__aiter__'):
+                    async for mail in mails:
+                        await start(count, mail)
+                        count += 1
+                else:
+                    for mail in mails:
+                        await start(count, mail)
+                        count += 1
+            except Exception as error:
+                await results.put(_Done(count, error))
+            else:
+                await results.put(_Done(count))
+
+        producer = loop.create_task(produce())
+
+        done = None
+        delivered = 0
+        try:
+            while done is None or delivered < done.count:
+                result = await results.get()
+                if isinstance(result, _Done):
+                    done = result
+                else:
+                    delivered += 1
+                    yield result
+        finally:
+            # the caller stopped iterating early
+            producer.cancel()
+            for task in list(tasks):
+                task.cancel()
+
+        if done.error is not None:
+            raise done.error
+
+    async def deliver(self, mails):
+        '''
+        Deliver the given E-Mails, see :py:func:`deliver_iter`.
+
+        :param mails: E-Mails to deliver
+        :type mails: async iterable or iterable of :py:class:`XarfMail`
+
+        :returns: One :py:class:`DeliveryResult` per mail in input order
+        :rtype: list
+        '''
+        results = [result async for result in self.deliver_iter(mails)]
+        return sorted(results, key=lambda result: result.index)
+
+    def close(self):
+        '''
+        Stop the delivery threads and close the pooled connections.
+        '''
+        self._executor.shutdown()
+        self.pool.close()
@@ -0,0 +1,245 @@
+'''
+Caching resolver for abuse contacts.
+'''
+import json
+import os
+import threading
+
+from collections import OrderedDict
+from time import time
+
+
+class ContactResolver(object):
+    '''
+    Looks up abuse contacts with querycontacts and caches the answers.
+
+    Answers are kept for ttl seconds, "no contact" answers for
+    negative_ttl seconds, and at most maxsize of them are kept, least
+    recently used first out. querycontacts answers per address, but
+    abuse contacts rarely differ within a network; if ipv4_prefix or
+    ipv6_prefix is set, an answer is reused for all addresses within
+    the same network of that prefix length.
+
+    If cache_path is set, answers are loaded from that file on creation
+    and written back by :py:func:`save`.
+
+    :param finder: Object with a find(ip) method (default: the shared
+        querycontacts ContactFinder)
+    :type finder: :py:class:`querycontacts.ContactFinder`
+    :param maxsize: Maximum number of cached answers
+    :type maxsize: int
+    :param ttl: Seconds to cache contacts
+    :type ttl: float
+    :param negative_ttl: Seconds to cache missing contacts
+    :type negative_ttl: float
+    :param ipv4_prefix: Prefix length to share answers for ipv4
+    :type ipv4_prefix: int
+    :param ipv6_prefix: Prefix length to share answers for ipv6
+    :type ipv6_prefix: int
+    :param cache_path: Path of the persistent cache file
+    :type cache_path: str
+    '''
+
+    def __init__(
+        self, finder=None, maxsize=10000, ttl=3600, negative_ttl=300,
+        ipv4_prefix=None, ipv6_prefix=None, cache_path=None
+    ):
+        self._finder = finder
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.ipv4_prefix = ipv4_prefix
+        self.ipv6_prefix = ipv6_prefix
+        self.cache_path = cache_path
+
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.lookup_time = 0.0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        if cache_path and os.path.exists(cache_path):
+            self._load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get_finder(self):
+        if self._finder is None:
+            from xarfmail.xarfmail import _get_contact_finder
+            self._finder = _get_contact_finder()
+        return self._finder
+
+    def _get_key(self, ip):
+        '''
+        Return the cache key of an ip address, which is its network if
+        answers are shared within a prefix.
+
+        :raises: :py:class:`ValueError`: if ip is not properly formatted
+        '''
+        if self.ipv4_prefix is None and self.ipv6_prefix is None:
+            return ip
+
+        import ipaddress
+
+        address = ipaddress.ip_address(u'%s' % ip)
+        if address.version == 4:
+            prefix = self.ipv4_prefix
+        else:
+            prefix = self.ipv6_prefix
+        if prefix is None:
+            return address.compressed
+
+        return ipaddress.ip_network(
+            u'%s/%d' % (address, prefix), strict=False
+        ).compressed
+
+    def lookup(self, ip):
+        '''
+        Look up the abuse contact(s) for the given ip, see
+        :py:func:`lookup_contact`.
+
+        :param ip: ip to lookup abuse contact for
+        :type ip: str
+
+        :returns: list of contacts or None
+        :rtype: list
+        :rtype: none
+
+        :raises: :py:class:`ImportError`
+        '''
+        key = self._get_key(ip)
+
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None and entry[0] > time():
+                # re-insert to mark as most recently used
+                self._entries[key] = entry
+                if entry[1] is None:
+                    self.negative_hits += 1
+                else:
+                    self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        started = time()
+        contacts = self._get_finder().find(ip)
+
+        with self._lock:
+            self.lookup_time += time() - started
+            self._add(key, contacts)
+
+        return contacts
+
+    def _add(self, key, contacts, expires=None):
+        '''
+        Cache an answer, evicting the least recently used ones.
+        '''
+        if expires is None:
+            expires = time() + (self.ttl if contacts else self.negative_ttl)
+        contacts = list(contacts) if contacts else None
+
+        self._entries.pop(key, None)
+        self._entries[key] = (expires, contacts)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        '''
+        Remove all cached answers and reset the counters.
+        '''
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.negative_hits = self.misses = 0
+            self.lookup_time = 0.0
+
+    def stats(self):
+        '''
+        returns cache counters and the mean latency of uncached lookups
+
+        :returns: hits, negative_hits, misses, size and lookup_ms
+        :rtype: dict
+        '''
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'negative_hits': self.negative_hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'lookup_ms': (
+                    1000.0 * self.lookup_time / self.misses
+                    if self.misses else 0.0
+                ),
+            }
+
+    def _load(self):
+        '''
+        Add the unexpired answers of the cache file. Files which cannot
+        be read are ignored, and so are malformed entries.
+        '''
+        try:
+            with open(self.cache_path) as f:
+                entries = json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+        if not isinstance(entries, dict):
+            return
+
+        now = time()
+        valid = []
+        for (key, entry) in entries.items():
+            if _is_entry(entry) and entry[0] > now:
+                valid.append((entry[0], key, entry[1]))
+
+        with self._lock:
+            for (expires, key, contacts) in sorted(valid):
+                self._add(key, contacts, expires)
+
+    def save(self):
+        '''
+        Write the unexpired answers to the cache file, replacing it
+        atomically.
+        '''
+        if not self.cache_path:
+            return
+
+        now = time()
+        with self._lock:
+            entries = dict(
+                (key, entry) for (key, entry) in self._entries.items()
+                if entry[0] > now
+            )
+
+        from tempfile import mkstemp
+
+        directory = os.path.dirname(os.path.abspath(self.cache_path))
+        (fd, tmp_path) = mkstemp(
+            prefix='.%s.' % os.path.basename(self.cache_path), dir=directory
+        )
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entries, f)
+            os.chmod(tmp_path, 0o644)
+            os.rename(tmp_path, self.cache_path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+
+def _is_entry(entry):
+    '''
+    Check that a cache file entry is an expiry time and None or a list
+    of contacts.
+    '''
+    if not isinstance(entry, list) or len(entry) != 2:
+        return False
+    (expires, contacts) = entry
+    if isinstance(expires, bool) or not isinstance(expires, (int, float)):
+        return False
+    if contacts is None:
+        return True
+    return isinstance(contacts, list) and all(
+        isinstance(contact, (str, type(u''))) for contact in contacts
+    )
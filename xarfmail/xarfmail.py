@@ -1,16 +1,70 @@
+import errno
+import re
 import smtplib
+import socket
+import threading
+
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from time import time
 from email import charset
+from email.errors import HeaderParseError
+from email.mime.base import MIMEBase
+from email.mime.message import MIMEMessage
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 
+try:
+    from email.generator import BytesGenerator
+except ImportError:
+    # python 2 generators already write bytes
+    from email.generator import Generator as BytesGenerator
+
+try:
+    from base64 import encodebytes
+except ImportError:
+    from base64 import encodestring as encodebytes
+
 
 charset.add_charset('utf-8', charset.SHORTEST, charset.QP)
 
-try:
-    from querycontacts import ContactFinder
-    cf = ContactFinder()
-except ImportError as exception:
-    cf = exception
+# socket errors of a lost or refused connection to the mail server
+_CONNECTION_ERRNOS = frozenset((
+    errno.EPIPE, errno.ECONNRESET, errno.ECONNABORTED, errno.ENOTCONN,
+    errno.ESHUTDOWN, errno.ECONNREFUSED, errno.EHOSTUNREACH,
+    errno.ENETUNREACH,
+))
+
+# stands in for the payload of evidence which is encoded while writing
+_EVIDENCE_MARKER = 'xarfmail-evidence-e1d2c3b4a596'
+
+# querycontacts pulls in dnspython, so it is set up on first lookup
+cf = None
+
+
+def _get_contact_finder():
+    '''
+    returns the shared querycontacts ContactFinder, creating it on
+    first use
+
+    :returns: contact finder
+    :rtype: :py:class:`querycontacts.ContactFinder`
+
+    :raises: :py:class:`ImportError`
+
+    '''
+    global cf
+
+    if cf is None:
+        try:
+            from querycontacts import ContactFinder
+            cf = ContactFinder()
+        except ImportError as exception:
+            cf = exception
+
+    if isinstance(cf, ImportError):
+        raise cf
+    return cf
 
 
 def lookup_contact(ip):
@@ -27,20 +81,252 @@ def lookup_contact(ip):
     :raises: :py:class:`ImportError`
 
     '''
-    if isinstance(cf, ImportError):
-        raise cf
-    else:
-        return cf.find(ip)
+    return _get_contact_finder().find(ip)
+
+
+def lookup_contacts(ips, max_workers=16, timeout=10, resolve=None):
+    '''
+    looks up abuse contacts for many ips in parallel. every distinct ip
+    is looked up once by up to max_workers threads. ips whose lookup
+    failed or took longer than timeout seconds map to None, a thread
+    stuck in a lookup is replaced so the others keep going.
+
+    :param ips: ips to lookup abuse contacts for
+    :type ips: iterable
+    :param max_workers: maximum number of concurrent lookups
+    :type max_workers: int
+    :param timeout: seconds to wait for a single lookup
+    :type timeout: float
+    :param resolve: callable returning the contacts for an ip address
+        (default: :py:func:`lookup_contact`)
+    :type resolve: callable
+
+    :returns: mapping of ip to list of contacts or None
+    :rtype: dict
+
+    :raises: :py:class:`ImportError`
+
+    '''
+    if resolve is None:
+        resolve = lookup_contact
+
+    pending = list(OrderedDict.fromkeys(ips))
+    pending.reverse()
+    count = len(pending)
+    results = {}
+    started = {}
+    errors = []
+    condition = threading.Condition()
+
+    def worker():
+        while True:
+            with condition:
+                if not pending or errors:
+                    return
+                ip = pending.pop()
+                started[ip] = time()
+
+            try:
+                contacts = resolve(ip)
+            except ImportError as error:
+                errors.append(error)
+                contacts = None
+            except Exception:
+                contacts = None
+
+            with condition:
+                condition.notify()
+                if started.pop(ip, None) is None:
+                    # timed out meanwhile and already replaced
+                    return
+                results[ip] = contacts
+
+    def start_worker():
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+
+    for _ in range(min(max_workers, count)):
+        start_worker()
+
+    with condition:
+        while len(results) < count and not errors:
+            now = time()
+            for (ip, start) in list(started.items()):
+                if now - start >= timeout:
+                    del started[ip]
+                    results[ip] = None
+                    start_worker()
+
+            if started:
+                condition.wait(min(started.values()) + timeout - now)
+            else:
+                condition.wait(timeout)
+
+    if errors:
+        raise errors[0]
+
+    return results
+
+
+def _write_base64(fileobj, evidence):
+    '''
+    Write evidence base64 encoded in lines of 76 characters, reading it
+    in chunks.
+    '''
+    rest = b''
+    for chunk in evidence.iter_chunks():
+        if rest:
+            chunk = rest + chunk
+        end = len(chunk) - len(chunk) % 57
+        rest = chunk[end:]
+        if end:
+            fileobj.write(encodebytes(chunk[:end]))
+
+    if rest:
+        fileobj.write(encodebytes(rest))
 
 
 class SMTPException(Exception): pass
 
 
+class _DataWriter(object):
+    '''
+    File-like object writing an E-Mail as payload of the SMTP DATA
+    command, with CRLF line endings and leading periods doubled.
+
+    :param sock: socket of the SMTP connection
+    :type sock: :py:class:`socket.socket`
+    :param bufsize: Number of bytes to collect before sending
+    :type bufsize: int
+    '''
+
+    _eol = re.compile(br'\r?\n')
+    _period = re.compile(br'^\.', re.M)
+
+    def __init__(self, sock, bufsize=65536):
+        self._sock = sock
+        self._bufsize = bufsize
+        self._partial = b''
+        self._buffer = []
+        self._size = 0
+
+    def write(self, data):
+        if not isinstance(data, bytes):
+            data = data.encode('ascii')
+
+        # only complete lines are quoted, the rest waits for more data
+        data = self._partial + data
+        end = data.rfind(b'\n') + 1
+        self._partial = data[end:]
+        if end:
+            self._send(data[:end])
+
+    def _send(self, lines):
+        lines = self._period.sub(b'..', self._eol.sub(b'\r\n', lines))
+        self._buffer.append(lines)
+        self._size += len(lines)
+        if self._size >= self._bufsize:
+            self.flush()
+
+    def flush(self):
+        self._sock.sendall(b''.join(self._buffer))
+        self._buffer = []
+        self._size = 0
+
+    def close(self):
+        '''
+        Send the remaining data and the terminating period.
+        '''
+        if self._partial:
+            self._send(self._partial + b'\r\n')
+            self._partial = b''
+        self._buffer.append(b'.\r\n')
+        self.flush()
+
+
+def _is_connection_error(error):
+    '''
+    Check if the error means the connection to the mail server was lost
+    or refused, unlike other socket errors such as a missing evidence
+    file (both are OSError on python 3).
+
+    :param error: delivery error
+    :type error: :py:class:`Exception`
+
+    :rtype: bool
+    '''
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    return isinstance(error, socket.error) and \
+        getattr(error, 'errno', None) in _CONNECTION_ERRNOS
+
+
+def _sendmail(smtp, mail_from, mail_to, email):
+    '''
+    Send an E-Mail like :py:func:`smtplib.SMTP.sendmail`, streaming
+    objects with a write_to method to the mail server.
+
+    :returns: refused recipients
+    :rtype: dict
+    '''
+    if not hasattr(email, 'write_to'):
+        return smtp.sendmail(mail_from, mail_to, email)
+
+    if type(mail_to) is not list:
+        mail_to = [mail_to]
+
+    smtp.ehlo_or_helo_if_needed()
+    (code, response) = smtp.mail(mail_from)
+    if code != 250:
+        smtp.rset()
+        raise smtplib.SMTPSenderRefused(code, response, mail_from)
+
+    refused = {}
+    for recipient in mail_to:
+        (code, response) = smtp.rcpt(recipient)
+        if code not in (250, 251):
+            refused[recipient] = (code, response)
+    if len(refused) == len(mail_to):
+        smtp.rset()
+        raise smtplib.SMTPRecipientsRefused(refused)
+
+    smtp.putcmd('data')
+    (code, response) = smtp.getreply()
+    if code != 354:
+        smtp.rset()
+        raise smtplib.SMTPDataError(code, response)
+
+    writer = _DataWriter(smtp.sock)
+    try:
+        email.write_to(writer)
+        writer.close()
+        (code, response) = smtp.getreply()
+    except BaseException:
+        # the server still waits for the end of the data, the connection
+        # is closed so the next E-Mail opens a new one
+        smtp.close()
+        raise
+    if code != 250:
+        smtp.rset()
+        raise smtplib.SMTPDataError(code, response)
+
+    return refused
+
+
+# outcome of delivering a single mail with :py:func:`SMTPPool.send_many`
+DeliveryResult = namedtuple('DeliveryResult', ('index', 'mail', 'error'))
+
+
 class SMTP(object):
 
     '''
     Class for sending E-Mails via SMTP
 
+    Used as context manager, the connection is kept open and reused for
+    all E-Mails sent within the block. Otherwise every call to
+    :py:func:`send` opens and closes its own connection.
+
     :param host: Mail server hostname or ip address
     :type host: str
     :param port: Port of mail server (default: 25)
@@ -49,18 +335,70 @@ class SMTP(object):
     :type user: str
     :param password: Password if SMTP auth is required
     :type password: str
+    :param timeout: Seconds to wait for connecting and for each reply
+        of the mail server (default: 60)
+    :type timeout: float
     '''
 
-    def __init__(self, host, port=25, user=None, password=None):
+    def __init__(self, host, port=25, user=None, password=None, timeout=60):
         self._host = host
         self._port = port
         self._user = user
         self._password = password
+        self._timeout = timeout
+        self._smtp = None
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def connect(self):
+        '''
+        Open a persistent connection to the mail server and log in,
+        replacing an already open connection.
+        '''
+        self.close()
+        self._smtp = self._connect()
+
+    def close(self):
+        '''
+        Close the persistent connection, if one is open.
+        '''
+        if self._smtp is None:
+            return
+
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, socket.error):
+            self._smtp.close()
+        self._smtp = None
+
+    def _connect(self):
+        '''
+        Open a new connection to the mail server and log in.
+
+        :returns: connected SMTP client
+        :rtype: :py:class:`smtplib.SMTP`
+        '''
+        smtp = smtplib.SMTP(self._host, self._port, timeout=self._timeout)
+
+        if self._user and self._password:
+            smtp.login(self._user, self._password)
+
+        return smtp
 
     def send(self, mail_from, mail_to, email):
         '''
         Send the E-Mail via SMTP to the specified mail server.
-        SMTP auth supported.
+        SMTP auth supported. A persistent connection which was closed
+        by the server is reopened once.
+
+        The E-Mail is either a string or an object with a write_to
+        method like :py:class:`XarfMail`, which is streamed to the mail
+        server without being flattened into a string first.
 
         :returns: True if mail was sent successfully
         :rtype: bool
@@ -68,13 +406,18 @@ class SMTP(object):
         :raises: :py:class:`SMTPException`
 
         '''
-        smtp = smtplib.SMTP(self._host, self._port)
-
-        if self._user and self._password:
-            smtp.login(self._user, self._password)
-
-        ret = smtp.sendmail(mail_from, mail_to, email)
-        smtp.quit()
+        if self._smtp is None:
+            smtp = self._connect()
+            ret = _sendmail(smtp, mail_from, mail_to, email)
+            smtp.quit()
+        else:
+            try:
+                ret = _sendmail(self._smtp, mail_from, mail_to, email)
+            except Exception as error:
+                if not _is_connection_error(error):
+                    raise
+                self.connect()
+                ret = _sendmail(self._smtp, mail_from, mail_to, email)
 
         if len(ret):
             raise SMTPException(ret)
@@ -82,6 +425,186 @@ class SMTP(object):
         return True
 
 
+class SMTPPool(object):
+    '''
+    Pool of persistent, authenticated SMTP connections to one mail
+    server, which can be shared between threads.
+
+    Connections are opened on demand, up to size at a time, and reused
+    by later calls. Connections idle for longer than idle_timeout
+    seconds are closed and reopened instead of being reused.
+
+    :param host: Mail server hostname or ip address
+    :type host: str
+    :param port: Port of mail server (default: 25)
+    :type port: int
+    :param user: Username if SMTP auth is required
+    :type user: str
+    :param password: Password if SMTP auth is required
+    :type password: str
+    :param size: Maximum number of open connections
+    :type size: int
+    :param idle_timeout: Seconds after which idle connections get closed
+    :type idle_timeout: float
+    :param timeout: Seconds to wait for connecting and for each reply
+        of the mail server (default: 60)
+    :type timeout: float
+    '''
+
+    def __init__(
+        self, host, port=25, user=None, password=None, size=4,
+        idle_timeout=60, timeout=60
+    ):
+        self._host = host
+        self._port = port
+        self._user = user
+        self._password = password
+        self._timeout = timeout
+        self.size = size
+        self.idle_timeout = idle_timeout
+
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def acquire(self):
+        '''
+        Take a connection out of the pool, blocking while all of them
+        are in use. It has to be given back with :py:func:`release`.
+
+        :returns: connected SMTP client
+        :rtype: :py:class:`SMTP`
+        '''
+        self._slots.acquire()
+
+        try:
+            with self._lock:
+                idle = self._idle.pop() if self._idle else None
+
+            if idle is not None:
+                (last_used, smtp) = idle
+                if time() - last_used < self.idle_timeout:
+                    return smtp
+                smtp.close()
+
+            smtp = SMTP(
+                self._host, self._port, self._user, self._password,
+                self._timeout
+            )
+            smtp.connect()
+            return smtp
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, smtp):
+        '''
+        Give a connection taken with :py:func:`acquire` back to the pool.
+
+        :param smtp: connected SMTP client
+        :type smtp: :py:class:`SMTP`
+        '''
+        with self._lock:
+            self._idle.append((time(), smtp))
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        '''
+        Context manager holding a connection of the pool.
+        '''
+        smtp = self.acquire()
+        try:
+            yield smtp
+        finally:
+            self.release(smtp)
+
+    def close(self):
+        '''
+        Close all idle connections.
+        '''
+        with self._lock:
+            (idle, self._idle) = (self._idle, [])
+
+        for (last_used, smtp) in idle:
+            smtp.close()
+
+    def send(self, mail_from, mail_to, email):
+        '''
+        Send the E-Mail over a pooled connection, see :py:func:`SMTP.send`.
+
+        :returns: True if mail was sent successfully
+        :rtype: bool
+
+        :raises: :py:class:`SMTPException`
+        '''
+        with self.connection() as smtp:
+            return smtp.send(mail_from, mail_to, email)
+
+    def send_many(self, mails, connections=None):
+        '''
+        Send the given E-Mails over up to connections pooled connections
+        in parallel. Mails are taken from the iterable as connections
+        become free, a failed mail does not stop the others.
+
+        :param mails: E-Mails to send
+        :type mails: iterable of :py:class:`XarfMail`
+        :param connections: Number of connections to use (default: size)
+        :type connections: int
+
+        :returns: One :py:class:`DeliveryResult` per mail in input order
+        :rtype: list
+        '''
+        pending = enumerate(mails)
+        pending_lock = threading.Lock()
+        results = {}
+        errors = []
+
+        def worker():
+            try:
+                smtp = self.acquire()
+            except Exception as error:
+                errors.append(error)
+                return
+
+            try:
+                while True:
+                    with pending_lock:
+                        try:
+                            (index, mail) = next(pending)
+                        except StopIteration:
+                            return
+                    try:
+                        smtp.send(mail.mail_from, mail.mail_to, mail)
+                    except Exception as error:
+                        results[index] = DeliveryResult(index, mail, error)
+                    else:
+                        results[index] = DeliveryResult(index, mail, None)
+            finally:
+                self.release(smtp)
+
+        threads = [
+            threading.Thread(target=worker)
+            for _ in range(min(connections or self.size, self.size))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # no connection could be opened for the remaining mails
+        for (index, mail) in pending:
+            results[index] = DeliveryResult(index, mail, errors[-1])
+
+        return [results[index] for index in sorted(results)]
+
+
 class MultiPartMail(object):
     '''
     Base class for multipart E-Mails
@@ -95,6 +618,11 @@ class MultiPartMail(object):
     :type mail_to: str or list
     '''
     def __init__(self, mail_to, mail_from, subject, subtype):
+        self.mail_to = mail_to
+        self.mail_from = mail_from
+        # evidence streamed by write_to, in order of their parts
+        self._evidence = []
+
         self._email = MIMEMultipart(subtype)
         self._email['From'] = mail_from
         self._email['Subject'] = subject
@@ -104,6 +632,55 @@ class MultiPartMail(object):
         else:
             self._email['To'] = mail_to
 
+    def __str__(self):
+        '''
+        Return the entire E-Mail flattened as a string.
+
+        :returns: raw email
+        :rtype: str
+        '''
+        if self._evidence:
+            from io import BytesIO
+
+            fileobj = BytesIO()
+            self.write_to(fileobj)
+            return fileobj.getvalue().decode('ascii')
+
+        return self._email.as_string()
+
+    def write_to(self, fileobj):
+        '''
+        Write the entire E-Mail flattened as bytes to a binary file
+        object, part by part instead of building one string first.
+        Evidence kept by reference is read and base64 encoded in chunks.
+
+        :param fileobj: file object opened for writing bytes
+        :type fileobj: file
+        '''
+        if not self._evidence:
+            BytesGenerator(fileobj, mangle_from_=False).flatten(self._email)
+            return
+
+        from io import BytesIO
+
+        skeleton = BytesIO()
+        BytesGenerator(skeleton, mangle_from_=False).flatten(self._email)
+        pieces = skeleton.getvalue().split(_EVIDENCE_MARKER.encode('ascii'))
+
+        fileobj.write(pieces[0])
+        for (evidence, piece) in zip(self._evidence, pieces[1:]):
+            _write_base64(fileobj, evidence)
+            fileobj.write(piece)
+
+    def to_string(self):
+        '''
+        Return the entire E-Mail flattened as a string.
+
+        :returns: raw email
+        :rtype: str
+        '''
+        return str(self)
+
 
 class XarfMail(MultiPartMail):
     '''
@@ -134,9 +711,245 @@ class XarfMail(MultiPartMail):
             MIMEText(xarf.to_yaml('machine_readable'), 'plain', 'utf-8')
         )
 
-        if xarf.evidence:
+        if hasattr(xarf.evidence, 'iter_chunks'):
+            self._attach_evidence(xarf)
+        elif xarf.evidence:
             self._email.attach(MIMEText(xarf.evidence, 'plain', 'utf-8'))
 
+    def _attach_evidence(self, xarf):
+        '''
+        Attach evidence kept by reference as base64 encoded part of the
+        report's attachment type, which is filled in by write_to.
+        '''
+        content_type = xarf.machine_readable.get('Attachment')
+        if not content_type or '/' not in content_type:
+            content_type = 'application/octet-stream'
+
+        part = MIMEBase(*content_type.split('/', 1))
+        part['Content-Transfer-Encoding'] = 'base64'
+        part.set_payload(_EVIDENCE_MARKER)
+        self._email.attach(part)
+        self._evidence.append(xarf.evidence)
+
+
+class XarfDigestMail(MultiPartMail):
+    '''
+    Helper class for building one E-Mail carrying several X-ARF reports
+    for the same recipient. Every report is attached as a complete X-ARF
+    E-Mail within a multipart/digest part.
+
+    :param xarfs: X-ARF objects to report
+    :type xarfs: list of :py:class:`Xarf`
+    :param mail_from: Sender E-Mail address
+    :type mail_from: str
+    :param mail_to: Recipient E-Mail address can be provided as list
+        for addressing multiple recipients
+    :type mail_to: str or list
+    :param subject: Subject of Network Abuse Report
+    :type subject: str
+    :param greeting: Human readable text, used for the digest and each
+        of the attached reports
+    :type greeting: unicode
+    '''
+    def __init__(self, xarfs, mail_from, mail_to, subject, greeting):
+        MultiPartMail.__init__(self, mail_to, mail_from, subject, 'mixed')
+
+        self._email['Auto-Submitted'] = 'auto-generated'
+        self._email.attach(MIMEText(greeting, 'plain', 'utf-8'))
+
+        digest = MIMEMultipart('digest')
+        for xarf in xarfs:
+            mail = XarfMail(xarf, mail_from, mail_to, subject, greeting)
+            digest.attach(MIMEMessage(mail._email))
+            self._evidence.extend(mail._evidence)
+        self._email.attach(digest)
+
+
+class _Placeholder(object):
+    '''
+    Stands in for an X-ARF object while a template is built.
+    '''
+    def __init__(self, evidence, attachment):
+        self.evidence = evidence
+        self.machine_readable = {'Attachment': attachment}
+
+    def to_yaml(self, part=None):
+        return _YAML_MARKER
+
+
+class _EvidencePlaceholder(object):
+    '''
+    Stands in for evidence kept by reference while a template is built.
+    '''
+    def iter_chunks(self):
+        return iter(())
+
+
+_TO_MARKER = 'xarfmail-to-e1d2c3b4a596'
+_YAML_MARKER = 'xarfmail-yaml-e1d2c3b4a596'
+_TEXT_MARKER = 'xarfmail-text-e1d2c3b4a596'
+_MARKERS = re.compile(('(%s)' % '|'.join(
+    (_TO_MARKER, _YAML_MARKER, _TEXT_MARKER, _EVIDENCE_MARKER)
+)).encode('ascii'))
+
+
+def _join_mail_to(mail_to):
+    '''
+    Return the recipient(s) as value of the To header.
+
+    :raises: :py:class:`email.errors.HeaderParseError` if a recipient
+        contains a line break, which would start a new header
+    '''
+    to = ','.join(mail_to) if type(mail_to) is list else mail_to
+    if '\r' in to or '\n' in to:
+        raise HeaderParseError('line break in recipient %r' % to)
+    return to
+
+
+class XarfMailTemplate(object):
+    '''
+    Renders X-ARF E-Mails which only differ in recipient and report,
+    like :py:class:`XarfMail` would build them. The headers, greeting
+    and MIME layout are encoded once per kind of evidence, rendering a
+    report only encodes its machine readable part and evidence.
+
+    :param mail_from: Sender E-Mail address
+    :type mail_from: str
+    :param subject: Subject of Network Abuse Report
+    :type subject: str
+    :param greeting: Human readable text for the first MIME part
+    :type greeting: unicode
+    '''
+    def __init__(self, mail_from, subject, greeting):
+        self.mail_from = mail_from
+        self.subject = subject
+        self.greeting = greeting
+
+        self._charset = charset.Charset('utf-8')
+        self._skeletons = {}
+
+    def _get_skeleton(self, kind):
+        '''
+        Return the encoded E-Mail for the given kind of evidence, split
+        into constant bytes and markers to fill in.
+
+        :param kind: None, 'text' or the content type of evidence kept
+            by reference
+        :type kind: str
+
+        :returns: boundary and pieces
+        :rtype: tuple
+        '''
+        if kind not in self._skeletons:
+            if kind is None:
+                placeholder = _Placeholder(None, None)
+            elif kind == 'text':
+                placeholder = _Placeholder(_TEXT_MARKER, None)
+            else:
+                placeholder = _Placeholder(_EvidencePlaceholder(), kind)
+
+            mail = XarfMail(
+                placeholder, self.mail_from, _TO_MARKER, self.subject,
+                self.greeting,
+            )
+
+            from io import BytesIO
+
+            skeleton = BytesIO()
+            BytesGenerator(skeleton, mangle_from_=False).flatten(mail._email)
+            self._skeletons[kind] = (
+                mail._email.get_boundary(),
+                _MARKERS.split(skeleton.getvalue()),
+            )
+
+        return self._skeletons[kind]
+
+    def render(self, xarf, mail_to):
+        '''
+        Render the E-Mail for a report.
+
+        :param xarf: X-ARF object to report
+        :type xarf: :py:class:`Xarf`
+        :param mail_to: Recipient E-Mail address can be provided as list
+            for addressing multiple recipients
+        :type mail_to: str or list
+
+        :returns: E-Mail which can be sent with :py:class:`SMTP`
+        :rtype: :py:class:`XarfMail` or rendered E-Mail
+
+        :raises: :py:class:`email.errors.HeaderParseError` if mail_to
+            contains a line break
+        '''
+        values = {}
+
+        to = _join_mail_to(mail_to)
+        try:
+            values[_TO_MARKER] = to.encode('ascii')
+        except UnicodeError:
+            from email.header import Header
+            values[_TO_MARKER] = Header(to, 'utf-8').encode().encode('ascii')
+
+        yaml = xarf.to_yaml('machine_readable')
+        values[_YAML_MARKER] = yaml
+
+        if hasattr(xarf.evidence, 'iter_chunks'):
+            kind = xarf.machine_readable.get('Attachment')
+            if not kind or '/' not in kind:
+                kind = 'application/octet-stream'
+            values[_EVIDENCE_MARKER] = xarf.evidence
+        elif xarf.evidence:
+            kind = 'text'
+            values[_TEXT_MARKER] = xarf.evidence
+        else:
+            kind = None
+
+        (boundary, pieces) = self._get_skeleton(kind)
+
+        for marker in (_YAML_MARKER, _TEXT_MARKER):
+            if marker in values:
+                if boundary in values[marker]:
+                    # the constant boundary can not be used for this one
+                    return XarfMail(
+                        xarf, self.mail_from, mail_to, self.subject,
+                        self.greeting,
+                    )
+                values[marker] = self._charset.body_encode(
+                    values[marker]
+                ).encode('ascii')
+
+        return _RenderedMail(self.mail_from, mail_to, pieces, values)
+
+
+class _RenderedMail(object):
+    '''
+    E-Mail rendered by :py:class:`XarfMailTemplate`, made of constant
+    bytes and the encoded parts of one report.
+    '''
+    def __init__(self, mail_from, mail_to, pieces, values):
+        self.mail_from = mail_from
+        self.mail_to = mail_to
+        self._pieces = pieces
+        self._values = values
+
+    def write_to(self, fileobj):
+        '''
+        Write the entire E-Mail as bytes to a binary file object, see
+        :py:func:`MultiPartMail.write_to`.
+
+        :param fileobj: file object opened for writing bytes
+        :type fileobj: file
+        '''
+        for (index, piece) in enumerate(self._pieces):
+            if not index % 2:
+                fileobj.write(piece)
+                continue
+
+            value = self._values[piece.decode('ascii')]
+            if hasattr(value, 'iter_chunks'):
+                _write_base64(fileobj, value)
+            else:
+                fileobj.write(value)
+
     def __str__(self):
         '''
         Return the entire E-Mail flattened as a string.
@@ -144,7 +957,11 @@ class XarfMail(MultiPartMail):
         :returns: raw email
         :rtype: str
         '''
-        return self._email.as_string()
+        from io import BytesIO
+
+        fileobj = BytesIO()
+        self.write_to(fileobj)
+        return fileobj.getvalue().decode('ascii')
 
     def to_string(self):
         '''